@@ -0,0 +1,270 @@
+"""Benchmark of the Cost.get_data ingest path.
+
+Generates synthetic MZC billing CSVs (stripped-header columns, Korean `소계` column with
+comma-formatted numbers), serves them through an in-memory stand-in of GoogleStorageConnector
+and measures each stage of the pipeline:
+
+    parse      CostManager._get_cost_data (CSV download + parse)
+    build      CostManager._make_cost_data (cost record build)
+    serialize  CostsInfo + SerializeToString (protobuf serialization)
+    get_data   CostManager.get_data end to end, including serialization
+
+Every stage runs in a forked process, so the reported peak RSS belongs to that stage only.
+
+Usage (from the repository root):
+
+    PYTHONPATH=src python benchmark/get_data_benchmark.py --rows 10000 100000 1000000
+
+`--format parquet` converts the same CSVs to Parquet (requires pyarrow).
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+from datetime import datetime
+
+from spaceone.core import config
+
+config.init_conf(package='spaceone.cost_analysis')
+
+from spaceone.cost_analysis.info import CostsInfo
+from spaceone.cost_analysis.manager import CostManager
+
+BUCKET = 'benchmark-billing-data'
+ORGANIZATION = 'benchmark'
+SUB_BILLING_ACCOUNT = 'ABCDEF-123456-GHIJKL'
+YEAR, MONTH = 2023, 1
+
+CSV_HEADER = [
+    'Billing Account ID', ' SBA ID', ' SBA Name', 'Project ID', ' Project Name ', 'Service ID', ' Service Name',
+    'SKU ID', ' SKU Name', 'Usage Start Date', 'Usage End Date', 'Usage', 'Usage Unit', 'Cost Type', ' 소계 '
+]
+SERVICES = ['Compute Engine', 'Cloud Storage', 'BigQuery', 'Cloud SQL', 'Networking', 'Cloud Logging',
+            'Kubernetes Engine', 'Cloud Pub/Sub', 'Cloud Run', 'Vertex AI']
+
+
+def make_billing_csv(rows, seed=0):
+    generator = random.Random(seed)
+    projects = [(f'benchmark-project-{index:03d}', f'Benchmark Project {index:03d} (production workload)')
+                for index in range(200)]
+    skus = [f'{service} SKU {index:04d} running in asia-northeast3' for service in SERVICES for index in range(300)]
+
+    output = io.StringIO()
+    output.write(','.join(CSV_HEADER) + '\n')
+    for _ in range(rows):
+        project_id, project_name = generator.choice(projects)
+        service_name = generator.choice(SERVICES)
+        sku_name = generator.choice(skus)
+        day = generator.randint(1, 31)
+        cost = generator.randint(0, 50_000_000)
+        output.write(
+            f'01A2B3-C4D5E6-F7G8H9,{SUB_BILLING_ACCOUNT},Benchmark SBA,{project_id},"{project_name}",'
+            f'{service_name[:4].upper()}-0000,{service_name},{sku_name[-4:]}-SKU,"{sku_name}",'
+            f'{YEAR}-{MONTH:02d}-{day:02d},{YEAR}-{MONTH:02d}-{day:02d},{generator.random() * 100:.6f},hour,'
+            f'regular,"{cost:,}"\n'
+        )
+
+    return output.getvalue().encode('utf-8')
+
+
+def convert_to_parquet(csv_data):
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+
+    table = pa_csv.read_csv(io.BytesIO(csv_data))
+    output = io.BytesIO()
+    pa_parquet.write_table(table, output)
+    return output.getvalue()
+
+
+def parse_option(option):
+    """Parses KEY=VALUE as a JSON value, so that `false` and `0` are not passed as truthy strings."""
+    key, value = option.split('=', 1)
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def make_exchange_rate_csv():
+    return ''.join(['year,month,KRW\n'] + [f'{YEAR},{month},1300\n' for month in range(1, 13)]).encode()
+
+
+class FakeBlob:
+
+    def __init__(self, name, data, generation):
+        self.name = name
+        self.data = data
+        self.size = len(data)
+        self.generation = generation
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode()
+
+    def reload(self, **kwargs):
+        pass
+
+    def open(self, mode='rb', **kwargs):
+        return io.BytesIO(self.data)
+
+    def download_as_bytes(self, start=None, end=None, **kwargs):
+        return self.data[start or 0:None if end is None else end + 1]
+
+
+class FakeGoogleStorageConnector:
+    """In-memory stand-in of GoogleStorageConnector."""
+
+    def __init__(self, objects):
+        self.blobs = {name: FakeBlob(name, data, generation) for generation, (name, data)
+                      in enumerate(objects.items(), start=1)}
+
+    def create_session(self, options, secret_data, schema):
+        pass
+
+    def bucket_exists(self, bucket_name):
+        return bucket_name == BUCKET
+
+    def list_objects(self, bucket_name, prefix=None, delimiter=None):
+        for name, blob in self.blobs.items():
+            if name.startswith(prefix or ''):
+                yield {'name': name, 'size': str(blob.size), 'generation': str(blob.generation),
+                       'md5Hash': blob.md5_hash, 'updated': '2023-02-01T00:00:00.000Z'}
+
+    def list_prefixes(self, bucket_name, prefix=None, delimiter='/'):
+        prefixes = {}
+        for name in self.blobs:
+            if name.startswith(prefix or '') and delimiter in name[len(prefix or ''):]:
+                prefixes[(prefix or '') + name[len(prefix or ''):].split(delimiter, 1)[0] + delimiter] = True
+
+        return list(prefixes)
+
+    def get_blob(self, bucket_name, file_path, generation=None):
+        return self.blobs[file_path]
+
+    def download_to_file(self, bucket_name, object_info, file_path, workers, range_size):
+        with open(file_path, 'wb') as f:
+            f.write(self.blobs[object_info['name']].data)
+
+
+def make_cost_manager(csv_data, options, file_format='csv'):
+    csv_path = f'{ORGANIZATION}/{SUB_BILLING_ACCOUNT}/{YEAR}/{MONTH:02d}/billing.{file_format}'
+    connector = FakeGoogleStorageConnector({
+        'settings/exchange_rate.csv': make_exchange_rate_csv(),
+        csv_path: csv_data
+    })
+
+    cost_mgr = CostManager()
+    cost_mgr.google_storage_connector = connector
+    cost_mgr.exchange_rate_mgr.google_storage_connector = connector
+    cost_mgr.cost_cache_connector.create_session(options)
+    cost_mgr.bucket = BUCKET
+    return cost_mgr, connector.get_blob(BUCKET, csv_path)
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_stage(stage, csv_data, options, file_format):
+    cost_mgr, blob = make_cost_manager(csv_data, options, file_format)
+    billed_at = datetime(YEAR, MONTH, 31)
+    pages = None
+
+    if stage in ('build', 'serialize'):
+        pages = list(cost_mgr._get_cost_data(blob, blob.name, blob.generation))
+
+    if stage == 'serialize':
+        pages = [cost_mgr._make_cost_data(page, billed_at, 1300) for page in pages]
+
+    baseline_rss = _peak_rss_mb()
+    rows = 0
+    first_page_at = None
+    started_at = time.perf_counter()
+
+    if stage == 'parse':
+        stream = cost_mgr._get_cost_data(blob, blob.name, blob.generation)
+    elif stage == 'build':
+        stream = (cost_mgr._make_cost_data(page, billed_at, 1300) for page in pages)
+    elif stage == 'serialize':
+        stream = (CostsInfo(page).SerializeToString() and page for page in pages)
+    else:
+        task_options = {
+            'start': f'{YEAR}-{MONTH:02d}-01',
+            'end': f'{YEAR}-{MONTH:02d}-31',
+            'bucket': BUCKET,
+            'organization': ORGANIZATION,
+            'sub_billing_account': SUB_BILLING_ACCOUNT
+        }
+        stream = (CostsInfo(page).SerializeToString() and page
+                  for page in cost_mgr.get_data(options, {}, None, task_options))
+
+    for page in stream:
+        if first_page_at is None:
+            first_page_at = time.perf_counter()
+        rows += len(page)
+
+    elapsed = time.perf_counter() - started_at
+    return {
+        'rows': rows,
+        'elapsed': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed else 0,
+        'first_page': (first_page_at or time.perf_counter()) - started_at,
+        'peak_rss_mb': _peak_rss_mb(),
+        'rss_growth_mb': _peak_rss_mb() - baseline_rss
+    }
+
+
+def _stage_worker(result_queue, stage, csv_data, options, file_format):
+    try:
+        result_queue.put(_run_stage(stage, csv_data, options, file_format))
+    except Exception as e:
+        result_queue.put({'error': repr(e)})
+
+
+def run_stage(stage, csv_data, options, file_format='csv'):
+    context = multiprocessing.get_context('fork')
+    result_queue = context.Queue()
+    process = context.Process(target=_stage_worker, args=(result_queue, stage, csv_data, options, file_format))
+    process.start()
+    result = result_queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Cost.get_data ingest path.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--stages', nargs='+', default=['parse', 'build', 'serialize', 'get_data'],
+                        choices=['parse', 'build', 'serialize', 'get_data'])
+    parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE',
+                        help='data source option passed to CostManager, with a JSON value (repeatable)')
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'], help='format of the billing file')
+    args = parser.parse_args()
+
+    options = dict(parse_option(option) for option in args.option)
+
+    print(f'{"rows":>9} {"stage":>10} {"rows/sec":>12} {"elapsed(s)":>11} {"first page(s)":>14} '
+          f'{"peak RSS(MB)":>13} {"RSS growth(MB)":>15}')
+
+    for rows in args.rows:
+        csv_data = make_billing_csv(rows)
+        if args.format == 'parquet':
+            csv_data = convert_to_parquet(csv_data)
+
+        for stage in args.stages:
+            result = run_stage(stage, csv_data, options, args.format)
+            if 'error' in result:
+                print(f'{rows:>9} {stage:>10} error: {result["error"]}')
+                continue
+
+            print(f'{result["rows"]:>9} {stage:>10} {result["rows_per_sec"]:>12,.0f} {result["elapsed"]:>11.3f} '
+                  f'{result["first_page"]:>14.3f} {result["peak_rss_mb"]:>13.1f} {result["rss_growth_mb"]:>15.1f}')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -34,8 +34,12 @@ setup(
         'spaceone-api',
         'schematics',
         'google-api-python-client',
+        'google-auth-httplib2',
         'google-cloud-storage',
-        'pandas'
+        'pandas',
+        'pyarrow',
+        'aiohttp',
+        'zstandard'
     ],
     zip_safe=False,
 )
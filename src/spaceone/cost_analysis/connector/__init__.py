@@ -1 +1,4 @@
 from spaceone.cost_analysis.connector.google_storage_connector import GoogleStorageConnector
+from spaceone.cost_analysis.connector.sync_state_connector import SyncStateConnector
+from spaceone.cost_analysis.connector.cost_cache_connector import CostCacheConnector
+from spaceone.cost_analysis.connector.async_google_storage_connector import AsyncGoogleStorageConnector
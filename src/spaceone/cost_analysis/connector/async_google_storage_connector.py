@@ -0,0 +1,332 @@
+import asyncio
+import io
+import logging
+import os
+import threading
+from urllib.parse import quote
+
+import google.auth.transport.requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from spaceone.core.connector import BaseConnector
+from spaceone.cost_analysis.error import *
+from spaceone.cost_analysis.connector.google_storage_connector import GoogleStorageConnector, _LIST_OBJECTS_FIELDS, \
+    _DOWNLOAD_RETRIES, _LIST_WORKERS, _get_google_clients, get_backoff, get_byte_ranges, verify_checksum
+
+_STORAGE_API_URL = 'https://storage.googleapis.com/storage/v1'
+_DOWNLOAD_API_URL = 'https://storage.googleapis.com/download/storage/v1'
+_MAX_CONNECTIONS = 32
+_MAX_CONCURRENT_LISTS = _LIST_WORKERS
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+_DOWNLOAD_READ_AHEAD_SIZE = 16 * 1024 * 1024
+_RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+_LOGGER = logging.getLogger(__name__)
+
+_CREDENTIALS_LOCK = threading.Lock()
+
+
+class _EventLoop:
+    """Event loop running in a single daemon thread, shared by every request of the process.
+
+    All GCS requests of the async connector run on it through one pooled aiohttp session,
+    so concurrent listings and downloads do not add threads.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.thread = threading.Thread(target=self.loop.run_forever, name='gcs-event-loop', daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get_session(self):
+        # Only called from coroutines running on the loop, so no lock is needed.
+        if self.session is None or self.session.closed:
+            # Objects stored with Content-Encoding: gzip are read as stored and decompressed by the caller,
+            # as GCS ignores Range headers when it decompresses them.
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=_MAX_CONNECTIONS),
+                raise_for_status=True,
+                auto_decompress=False
+            )
+
+        return self.session
+
+
+_EVENT_LOOP = None
+_EVENT_LOOP_LOCK = threading.Lock()
+
+
+def _get_event_loop():
+    global _EVENT_LOOP
+
+    with _EVENT_LOOP_LOCK:
+        if _EVENT_LOOP is None:
+            _EVENT_LOOP = _EventLoop()
+
+        return _EVENT_LOOP
+
+
+def _refresh_credentials(credentials):
+    with _CREDENTIALS_LOCK:
+        if not credentials.valid:
+            credentials.refresh(google.auth.transport.requests.Request())
+
+
+class AsyncGoogleStorageConnector(BaseConnector):
+    """GoogleStorageConnector variant that runs GCS requests on a shared asyncio event loop.
+
+    It keeps the synchronous interface of GoogleStorageConnector. `list_objects_concurrently` lists several
+    prefixes at once without a thread per request. Blobs returned by `get_blob` download in the background
+    while the caller reads them. Requires aiohttp.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.project_id = None
+        self.clients = None
+        self.event_loop = None
+
+    @staticmethod
+    def is_enabled(options: dict):
+        if not options.get('async_io', False):
+            return False
+
+        if aiohttp is None:
+            _LOGGER.warning('[is_enabled] aiohttp is not installed. The blocking GCS client is used instead.')
+            return False
+
+        return True
+
+    def create_session(self, options: dict, secret_data: dict, schema: str):
+        GoogleStorageConnector._check_secret_data(secret_data)
+        self.project_id = secret_data['project_id']
+
+        self.clients = _get_google_clients(secret_data)
+        self.event_loop = _get_event_loop()
+
+    def bucket_exists(self, bucket_name):
+        if bucket_name in self.clients.bucket_names:
+            return True
+
+        try:
+            self.event_loop.run(self._get_json(f'{_STORAGE_API_URL}/b/{quote(bucket_name, safe="")}',
+                                               params={'fields': 'name'}))
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                return False
+            raise e
+
+        self.clients.bucket_names.add(bucket_name)
+        return True
+
+    def list_objects(self, bucket_name, prefix=None, delimiter=None):
+        yield from self.event_loop.run(self._list_objects(bucket_name, prefix, delimiter))['items']
+
+    def list_prefixes(self, bucket_name, prefix=None, delimiter='/'):
+        yield from self.event_loop.run(self._list_objects(bucket_name, prefix, delimiter))['prefixes']
+
+    def list_objects_concurrently(self, bucket_name, prefixes, delimiter=None):
+        """Lists every prefix concurrently and returns their items and sub prefixes by prefix."""
+        return self.event_loop.run(self._list_objects_concurrently(bucket_name, list(prefixes), delimiter))
+
+    def get_blob(self, bucket_name, file_path, generation=None):
+        return AsyncBlob(self, bucket_name, file_path, generation)
+
+    def download_to_file(self, bucket_name, object_info, file_path, workers, range_size):
+        """Same as GoogleStorageConnector.download_to_file, with the ranges fetched concurrently on the event loop."""
+        byte_ranges = get_byte_ranges(int(object_info['size']), range_size)
+
+        with open(file_path, 'wb') as f:
+            f.truncate(int(object_info['size']))
+
+        fd = os.open(file_path, os.O_WRONLY)
+        try:
+            self.event_loop.run(self._download_ranges(bucket_name, object_info, fd, byte_ranges, workers))
+        finally:
+            os.close(fd)
+
+        verify_checksum(file_path, object_info)
+
+    async def _list_objects_concurrently(self, bucket_name, prefixes, delimiter):
+        semaphore = asyncio.Semaphore(_MAX_CONCURRENT_LISTS)
+
+        async def _list(prefix):
+            async with semaphore:
+                return await self._list_objects(bucket_name, prefix, delimiter)
+
+        responses = await asyncio.gather(*[_list(prefix) for prefix in prefixes])
+        return dict(zip(prefixes, responses))
+
+    async def _list_objects(self, bucket_name, prefix, delimiter):
+        url = f'{_STORAGE_API_URL}/b/{quote(bucket_name, safe="")}/o'
+        params = {'fields': _LIST_OBJECTS_FIELDS}
+        if prefix:
+            params['prefix'] = prefix
+        if delimiter:
+            params['delimiter'] = delimiter
+
+        result = {'items': [], 'prefixes': []}
+        while True:
+            response = await self._get_json(url, params=params)
+            result['items'].extend(response.get('items', []))
+            result['prefixes'].extend(response.get('prefixes', []))
+
+            if 'nextPageToken' not in response:
+                return result
+
+            params['pageToken'] = response['nextPageToken']
+
+    async def _get_json(self, url, params=None):
+        async with self.event_loop.get_session().get(url, params=params,
+                                                     headers=await self._get_headers()) as response:
+            return await response.json()
+
+    async def _download_ranges(self, bucket_name, object_info, fd, byte_ranges, workers):
+        semaphore = asyncio.Semaphore(max(workers, 1))
+
+        async def _download(start, end):
+            async with semaphore:
+                await self._download_range(bucket_name, object_info, fd, start, end)
+
+        tasks = [asyncio.ensure_future(_download(start, end)) for start, end in byte_ranges]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _download_range(self, bucket_name, object_info, fd, start, end):
+        url = f'{_DOWNLOAD_API_URL}/b/{quote(bucket_name, safe="")}/o/{quote(object_info["name"], safe="")}'
+        params = {'alt': 'media'}
+        if object_info.get('generation'):
+            params['generation'] = object_info['generation']
+
+        attempt = 0
+        while start <= end:
+            try:
+                headers = {**await self._get_headers(), 'Range': f'bytes={start}-{end}'}
+                async with self.event_loop.get_session().get(url, params=params, headers=headers) as response:
+                    async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+                        os.pwrite(fd, chunk, start)
+                        start += len(chunk)
+
+                if start <= end:
+                    raise aiohttp.ClientPayloadError(f'incomplete response of bytes {start}-{end}')
+            except aiohttp.ClientResponseError as e:
+                if e.status == 404:
+                    raise ERROR_BILLING_FILE_CHANGED(target_file=object_info['name'],
+                                                     generation=object_info.get('generation'))
+                if e.status not in _RETRYABLE_STATUS_CODES or attempt >= _DOWNLOAD_RETRIES:
+                    raise e
+
+                await self._wait_retry(object_info, start, end, attempt, e)
+                attempt += 1
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if attempt >= _DOWNLOAD_RETRIES:
+                    raise e
+
+                await self._wait_retry(object_info, start, end, attempt, e)
+                attempt += 1
+
+    @staticmethod
+    async def _wait_retry(object_info, start, end, attempt, error):
+        _LOGGER.debug(f'[download_range] retry bytes {start}-{end} of {object_info["name"]}: {error}')
+        await asyncio.sleep(get_backoff(attempt))
+
+    async def _download(self, bucket_name, file_path, generation, chunks, chunk_size):
+        url = f'{_DOWNLOAD_API_URL}/b/{quote(bucket_name, safe="")}/o/{quote(file_path, safe="")}'
+        params = {'alt': 'media'}
+        if generation:
+            params['generation'] = generation
+
+        try:
+            async with self.event_loop.get_session().get(url, params=params,
+                                                         headers=await self._get_headers()) as response:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    await chunks.put(chunk)
+
+            await chunks.put(b'')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await chunks.put(e)
+
+    async def _get_headers(self):
+        # The pooled credentials are scoped to devstorage.read_only, and their token is shared with the
+        # blocking clients of the same secret_data.
+        credentials = self.clients.credentials
+        if not credentials.valid:
+            await asyncio.get_running_loop().run_in_executor(None, _refresh_credentials, credentials)
+
+        return {'Authorization': f'Bearer {credentials.token}'}
+
+
+class AsyncBlob:
+    """Blob of AsyncGoogleStorageConnector, exposing the subset of google.cloud.storage.Blob the plugin uses."""
+
+    def __init__(self, connector: AsyncGoogleStorageConnector, bucket_name, name, generation=None):
+        self.connector = connector
+        self.bucket_name = bucket_name
+        self.name = name
+        self.generation = generation
+
+    def open(self, mode='rb', chunk_size=_DOWNLOAD_CHUNK_SIZE, **kwargs):
+        if mode != 'rb':
+            raise ValueError(f'Unsupported mode: {mode}')
+
+        return _AsyncObjectReader(self.connector, self.bucket_name, self.name, self.generation, chunk_size)
+
+
+class _AsyncObjectReader(io.RawIOBase):
+    """Readable file of an object downloaded on the event loop, at most 16MB ahead of the reader."""
+
+    def __init__(self, connector: AsyncGoogleStorageConnector, bucket_name, file_path, generation, chunk_size):
+        self.event_loop = connector.event_loop
+        self.chunks = self.event_loop.run(self._create_queue(max(_DOWNLOAD_READ_AHEAD_SIZE // chunk_size, 1)))
+        self.task = asyncio.run_coroutine_threadsafe(
+            connector._download(bucket_name, file_path, generation, self.chunks, chunk_size), self.event_loop.loop
+        )
+        self.pending = memoryview(b'')
+        self.eof = False
+
+    @staticmethod
+    async def _create_queue(max_chunks):
+        return asyncio.Queue(maxsize=max_chunks)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            if self.eof:
+                return 0
+
+            chunk = self.event_loop.run(self.chunks.get())
+            if isinstance(chunk, Exception):
+                raise chunk
+
+            if not chunk:
+                self.eof = True
+                return 0
+
+            self.pending = memoryview(chunk)
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.task.cancel()
+            self.pending = memoryview(b'')
+
+        super().close()
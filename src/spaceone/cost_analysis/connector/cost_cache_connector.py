@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from spaceone.core.connector import BaseConnector
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+_DEFAULT_CACHE_MAX_SIZE_MB = 1024
+# Bumped whenever the columns of the cached pages change
+_CACHE_VERSION = 2
+
+_LOGGER = logging.getLogger(__name__)
+
+_EVICTION_LOCK = threading.Lock()
+
+
+class CostCacheConnector(BaseConnector):
+    """Local cache of parsed billing months, stored as Arrow IPC streams keyed by bucket, path and generation.
+
+    The cache is enabled by the `cache_dir` option and requires pyarrow. Cache hits are memory-mapped and
+    streamed batch by batch. The least recently used files are evicted once `cache_max_size_mb` is exceeded.
+    Categorical columns are stored as dictionaries, which the stream format allows to change between batches.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_dir = None
+        self.max_size = 0
+
+    def create_session(self, options: dict):
+        self.cache_dir = options.get('cache_dir')
+        self.max_size = int(options.get('cache_max_size_mb', _DEFAULT_CACHE_MAX_SIZE_MB)) * 1024 * 1024
+
+        if self.cache_dir and pa is None:
+            _LOGGER.warning('[create_session] pyarrow is not installed. The cost cache is disabled.')
+            self.cache_dir = None
+
+    def is_cacheable(self, generation):
+        return bool(self.cache_dir and generation)
+
+    def read(self, bucket_name, file_path, generation):
+        cache_path = self._get_cache_path(bucket_name, file_path, generation)
+        try:
+            source = pa.memory_map(cache_path, 'r')
+        except FileNotFoundError:
+            return None
+
+        try:
+            reader = pa.ipc.open_stream(source)
+        except Exception as e:
+            _LOGGER.debug(f'[read] remove invalid cache ({cache_path}): {e}')
+            source.close()
+            self._remove(cache_path)
+            return None
+
+        os.utime(cache_path)
+        return self._read_batches(source, reader)
+
+    def writer(self, bucket_name, file_path, generation):
+        return _CacheWriter(self, self._get_cache_path(bucket_name, file_path, generation))
+
+    @staticmethod
+    def _read_batches(source, reader):
+        with source:
+            for record_batch in reader:
+                yield record_batch.to_pandas()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _get_cache_path(self, bucket_name, file_path, generation):
+        key = hashlib.sha256(f'{bucket_name}/{file_path}#{generation}@{_CACHE_VERSION}'.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.arrow')
+
+    def evict(self):
+        with _EVICTION_LOCK:
+            cache_files = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.arrow'):
+                    stat = entry.stat()
+                    cache_files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_size = sum(size for _, size, _ in cache_files)
+            for _, size, path in sorted(cache_files):
+                if total_size <= self.max_size:
+                    break
+
+                try:
+                    os.remove(path)
+                    total_size -= size
+                except FileNotFoundError:
+                    continue
+
+
+class _CacheWriter:
+
+    def __init__(self, connector: CostCacheConnector, cache_path):
+        self.connector = connector
+        self.cache_path = cache_path
+        self.temp_path = None
+        self.sink = None
+        self.writer = None
+        self.schema = None
+        self.failed = False
+
+    def __enter__(self):
+        return self
+
+    def write(self, data_frame):
+        if self.failed:
+            return
+
+        try:
+            if self.writer is None:
+                os.makedirs(self.connector.cache_dir, exist_ok=True)
+                fd, self.temp_path = tempfile.mkstemp(dir=self.connector.cache_dir, suffix='.tmp')
+                os.close(fd)
+
+                record_batch = pa.RecordBatch.from_pandas(data_frame, preserve_index=False)
+                self.schema = pa.schema([
+                    field.with_type(self._normalize_type(field.type)) for field in record_batch.schema
+                ])
+                self.sink = pa.OSFile(self.temp_path, 'wb')
+                self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+            record_batch = pa.RecordBatch.from_pandas(data_frame, schema=self.schema, preserve_index=False)
+
+            self.writer.write_batch(record_batch)
+        except Exception as e:
+            _LOGGER.debug(f'[write] skip caching ({self.cache_path}): {e}')
+            self.failed = True
+
+    @staticmethod
+    def _normalize_type(data_type):
+        # Pages that are empty in a column are inferred as null, and categories as dictionaries
+        # with the smallest index type, so the types are widened to hold every page of the month.
+        if pa.types.is_dictionary(data_type):
+            return pa.dictionary(pa.int32(), pa.string())
+        if pa.types.is_null(data_type) or pa.types.is_large_string(data_type):
+            return pa.string()
+        return data_type
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self.writer:
+                self.writer.close()
+            if self.sink:
+                self.sink.close()
+
+            if self.temp_path and exc_type is None and not self.failed:
+                os.replace(self.temp_path, self.cache_path)
+                self.temp_path = None
+                self.connector.evict()
+        except Exception as e:
+            _LOGGER.debug(f'[__exit__] failed to store cache ({self.cache_path}): {e}')
+        finally:
+            if self.temp_path and os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+
+        return False
@@ -1,16 +1,142 @@
+import base64
+import hashlib
+import json
 import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import google.oauth2.service_account
+import google_auth_httplib2
+import httplib2
+import requests
+from google.api_core import exceptions as api_exceptions
 from google.cloud import storage
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
 
 from spaceone.core.connector import BaseConnector
 from spaceone.cost_analysis.error import *
 
 MAX_OBJECTS = 100000
+_STORAGE_SCOPES = ['https://www.googleapis.com/auth/devstorage.read_only']
+_LIST_OBJECTS_FIELDS = 'nextPageToken,prefixes,items(name,size,updated,generation,md5Hash,crc32c,contentEncoding)'
+
+_CLIENT_POOL_SIZE = 32
+_CLIENT_POOL_TTL = 3600
+
+_LIST_WORKERS = 16
+_DOWNLOAD_RETRIES = 5
+_DOWNLOAD_INITIAL_BACKOFF = 0.5
+_DOWNLOAD_MAX_BACKOFF = 30
+_CHECKSUM_CHUNK_SIZE = 8 * 1024 * 1024
+_RETRYABLE_DOWNLOAD_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    ConnectionError,
+    TimeoutError
+)
 
 _LOGGER = logging.getLogger(__name__)
 
 
+class _GoogleClients:
+    """Authenticated clients shared by every session created from the same secret_data.
+
+    The credentials are scoped when they are created, so the storage client, the discovery client and
+    the authorized http all use this same object instead of a scoped copy of their own. Its access token
+    stays cached between calls and is only refreshed when it is about to expire. httplib2 is not thread-safe,
+    so the discovery client executes its requests through a per-thread authorized http.
+    """
+
+    def __init__(self, secret_data):
+        self.credentials = google.oauth2.service_account.Credentials.from_service_account_info(
+            secret_data, scopes=_STORAGE_SCOPES
+        )
+        self.storage_client = storage.Client(project=secret_data['project_id'], credentials=self.credentials)
+        self.google_client = build('storage', 'v1', credentials=self.credentials, cache_discovery=False)
+        self.created_at = time.monotonic()
+        self.bucket_names = set()
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        if not hasattr(self._local, 'http'):
+            self._local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+
+        return self._local.http
+
+    def is_expired(self):
+        return time.monotonic() - self.created_at > _CLIENT_POOL_TTL
+
+
+_CLIENT_POOL = OrderedDict()
+_CLIENT_POOL_LOCK = threading.Lock()
+
+
+def _get_google_clients(secret_data):
+    key = hashlib.sha256(json.dumps(secret_data, sort_keys=True).encode()).hexdigest()
+
+    with _CLIENT_POOL_LOCK:
+        clients = _CLIENT_POOL.get(key)
+        if clients and not clients.is_expired():
+            _CLIENT_POOL.move_to_end(key)
+            return clients
+
+    clients = _GoogleClients(secret_data)
+
+    with _CLIENT_POOL_LOCK:
+        _CLIENT_POOL[key] = clients
+        _CLIENT_POOL.move_to_end(key)
+        while len(_CLIENT_POOL) > _CLIENT_POOL_SIZE:
+            _CLIENT_POOL.popitem(last=False)
+
+    return clients
+
+
+def get_byte_ranges(size, range_size):
+    """Splits `size` bytes into inclusive (start, end) ranges of at most `range_size` bytes."""
+    return [(start, min(start + range_size, size) - 1) for start in range(0, size, max(range_size, 1))]
+
+
+def get_backoff(attempt):
+    return min(_DOWNLOAD_INITIAL_BACKOFF * 2 ** attempt, _DOWNLOAD_MAX_BACKOFF) * random.uniform(0.5, 1.0)
+
+
+def verify_checksum(file_path, object_info):
+    """Verifies a downloaded file against the crc32c or md5Hash of its listing.
+
+    crc32c is preferred as it is cheaper to compute. Composite objects only have a crc32c.
+    """
+    if object_info.get('crc32c') and google_crc32c is not None:
+        expected, checksum = object_info['crc32c'], google_crc32c.Checksum()
+    elif object_info.get('md5Hash'):
+        expected, checksum = object_info['md5Hash'], hashlib.md5()
+    else:
+        return
+
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(_CHECKSUM_CHUNK_SIZE):
+            checksum.update(chunk)
+
+    if base64.b64encode(checksum.digest()).decode() != expected:
+        raise ERROR_BILLING_FILE_CHECKSUM_MISMATCH(target_file=object_info['name'])
+
+
 class GoogleStorageConnector(BaseConnector):
 
     def __init__(self, *args, **kwargs):
@@ -19,28 +145,119 @@ class GoogleStorageConnector(BaseConnector):
         self.session = None
         self.storage_client = None
         self.google_client = None
+        self.clients = None
 
     def create_session(self, options: dict, secret_data: dict, schema: str):
         self._check_secret_data(secret_data)
         self.project_id = secret_data['project_id']
 
-        credentials = google.oauth2.service_account.Credentials.from_service_account_info(secret_data)
-        self.storage_client = storage.Client(project=secret_data['project_id'], credentials=credentials)
-        self.google_client = build('storage', 'v1', credentials=credentials)
+        self.clients = _get_google_clients(secret_data)
+        self.storage_client = self.clients.storage_client
+        self.google_client = self.clients.google_client
 
     def list_buckets(self):
-        buckets = self.google_client.buckets().list(project=self.project_id).execute()
+        buckets = self.google_client.buckets().list(project=self.project_id).execute(http=self.clients.http)
         return buckets.get('items', [])
 
-    def list_objects(self, bucket_name, prefix=None):
-        self.google_client.buckets().get(bucket=bucket_name).execute()
-        objects = self.google_client.objects().list(bucket=bucket_name, prefix=prefix).execute()
-        return objects.get('items', [])
+    def bucket_exists(self, bucket_name):
+        if bucket_name in self.clients.bucket_names:
+            return True
+
+        try:
+            self.google_client.buckets().get(bucket=bucket_name, fields='name').execute(http=self.clients.http)
+        except HttpError as e:
+            if e.resp.status == 404:
+                return False
+            raise e
+
+        self.clients.bucket_names.add(bucket_name)
+        return True
+
+    def list_objects(self, bucket_name, prefix=None, delimiter=None):
+        for response in self._list_object_pages(bucket_name, prefix, delimiter):
+            yield from response.get('items', [])
+
+    def list_prefixes(self, bucket_name, prefix=None, delimiter='/'):
+        for response in self._list_object_pages(bucket_name, prefix, delimiter):
+            yield from response.get('prefixes', [])
+
+    def list_objects_concurrently(self, bucket_name, prefixes, delimiter=None):
+        """Lists every prefix on a thread pool and returns their items and sub prefixes by prefix."""
+        prefixes = list(prefixes)
+        with ThreadPoolExecutor(max_workers=max(min(_LIST_WORKERS, len(prefixes)), 1),
+                                thread_name_prefix='gcs-list') as executor:
+            responses = executor.map(lambda prefix: self._list_objects(bucket_name, prefix, delimiter), prefixes)
+            return dict(zip(prefixes, responses))
+
+    def _list_objects(self, bucket_name, prefix, delimiter):
+        result = {'items': [], 'prefixes': []}
+        for response in self._list_object_pages(bucket_name, prefix, delimiter):
+            result['items'].extend(response.get('items', []))
+            result['prefixes'].extend(response.get('prefixes', []))
+
+        return result
+
+    def _list_object_pages(self, bucket_name, prefix, delimiter):
+        objects = self.google_client.objects()
+        request = objects.list(bucket=bucket_name, prefix=prefix, delimiter=delimiter, fields=_LIST_OBJECTS_FIELDS)
+        while request is not None:
+            response = request.execute(http=self.clients.http)
+            yield response
+            request = objects.list_next(request, response)
+
+    def get_blob(self, bucket_name, file_path, generation=None):
+        # Readers of a blob fetch it in several ranged requests, which the generation keeps on one version.
+        return self.storage_client.bucket(bucket_name).blob(file_path, generation=generation)
+
+    def download_to_file(self, bucket_name, object_info, file_path, workers, range_size):
+        """Downloads an object into `file_path` as byte ranges fetched in parallel.
+
+        The stored bytes are downloaded as they are, without decompressive transcoding of gzip encoded objects.
+        The generation of `object_info` is pinned, so every range comes from the same version of the object.
+        A failed range is retried with exponential backoff from the last byte it wrote, without restarting
+        the other ranges. The file is verified against the checksum of `object_info` at the end.
+        """
+        generation = int(object_info['generation']) if object_info.get('generation') else None
+        blob = self.storage_client.bucket(bucket_name).blob(object_info['name'], generation=generation)
+        byte_ranges = get_byte_ranges(int(object_info['size']), range_size)
+
+        with open(file_path, 'wb') as f:
+            f.truncate(int(object_info['size']))
+
+        fd = os.open(file_path, os.O_WRONLY)
+        executor = ThreadPoolExecutor(max_workers=max(min(workers, len(byte_ranges)), 1),
+                                      thread_name_prefix='gcs-download')
+        try:
+            futures = [executor.submit(self._download_range, blob, fd, start, end) for start, end in byte_ranges]
+            for future in futures:
+                future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            os.close(fd)
+
+        verify_checksum(file_path, object_info)
+
+    @staticmethod
+    def _download_range(blob, fd, start, end):
+        attempt = 0
+        while start <= end:
+            try:
+                data = blob.download_as_bytes(start=start, end=end, raw_download=True, checksum=None, retry=None)
+                if not data:
+                    raise ConnectionError(f'empty response of bytes {start}-{end}')
+            except api_exceptions.NotFound:
+                raise ERROR_BILLING_FILE_CHANGED(target_file=blob.name, generation=blob.generation)
+            except _RETRYABLE_DOWNLOAD_ERRORS as e:
+                if attempt >= _DOWNLOAD_RETRIES:
+                    raise e
+
+                _LOGGER.debug(f'[download_range] retry bytes {start}-{end} of {blob.name}: {e}')
+                time.sleep(get_backoff(attempt))
+                attempt += 1
+                continue
 
-    def get_blob(self, bucket_name, file_path):
-        bucket = self.storage_client.get_bucket(bucket_name)
-        blob = bucket.get_blob(file_path)
-        return blob
+            os.pwrite(fd, data, start)
+            start += len(data)
 
     @staticmethod
     def _check_secret_data(secret_data):
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from spaceone.core.connector import BaseConnector
+
+_DEFAULT_STATE_DIR = os.path.join(tempfile.gettempdir(), 'spaceone-mzc-google-cost', 'sync_state')
+
+_LOGGER = logging.getLogger(__name__)
+
+_STATE_LOCK = threading.Lock()
+
+
+class SyncStateConnector(BaseConnector):
+    """Stores the GCS object versions (generation, md5Hash, updated) handed out as tasks in a local JSON file.
+
+    One plugin process serves the data sources of many domains, so the state is kept per domain as well as
+    per bucket and organization. Otherwise a version recorded for one domain would hide a change from another.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.state_dir = None
+
+    def create_session(self, options: dict):
+        self.state_dir = options.get('sync_state_dir', _DEFAULT_STATE_DIR)
+
+    def get_state(self, domain_id, bucket_name, organization):
+        state_path = self._get_state_path(domain_id, bucket_name, organization)
+
+        with _STATE_LOCK:
+            try:
+                with open(state_path, 'r') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return {}
+            except Exception as e:
+                _LOGGER.error(f'[get_state] failed to read sync state ({state_path}): {e}')
+                return {}
+
+    def update_state(self, domain_id, bucket_name, organization, state):
+        state_path = self._get_state_path(domain_id, bucket_name, organization)
+
+        with _STATE_LOCK:
+            try:
+                os.makedirs(self.state_dir, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(dir=self.state_dir, suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(state, f)
+
+                os.replace(temp_path, state_path)
+            except Exception as e:
+                _LOGGER.error(f'[update_state] failed to write sync state ({state_path}): {e}')
+
+    def _get_state_path(self, domain_id, bucket_name, organization):
+        key = hashlib.sha256(f'{domain_id}/{bucket_name}/{organization}'.encode()).hexdigest()
+        return os.path.join(self.state_dir, f'{key}.json')
@@ -19,3 +19,19 @@ class ERROR_NOT_FOUND_BUCKET(ERROR_UNKNOWN):
 
 class ERROR_NOT_VALID_ORGANIZATION(ERROR_UNKNOWN):
     _message = 'Not valid organization: {organization}'
+
+
+class ERROR_REQUIRED_BILLING_COLUMN(ERROR_UNKNOWN):
+    _message = 'Required columns not found in billing file: {columns} ({target_file})'
+
+
+class ERROR_BILLING_FILE_CHANGED(ERROR_UNKNOWN):
+    _message = 'Billing file changed while downloading: {target_file} (generation: {generation})'
+
+
+class ERROR_BILLING_FILE_CHECKSUM_MISMATCH(ERROR_UNKNOWN):
+    _message = 'Checksum of downloaded billing file does not match: {target_file}'
+
+
+class ERROR_UNSUPPORTED_BILLING_FILE(ERROR_UNKNOWN):
+    _message = 'Unsupported billing file: {target_file} ({reason})'
@@ -1,5 +1,6 @@
 import functools
 import logging
+import pandas as pd
 from spaceone.api.cost_analysis.plugin import cost_pb2
 from spaceone.core.pygrpc.message_type import *
 from spaceone.core import utils
@@ -38,5 +39,70 @@ def CostInfo(cost_data):
         raise e
 
 
+_COST_FIELDS = ['currency', 'usage_quantity', 'provider', 'region_code', 'category', 'product', 'account',
+                'usage_type', 'usage_unit', 'resource']
+
+
+def _column_values(costs_frame, column):
+    values = costs_frame[column]
+    if values.hasnans:
+        values = values.astype(object).where(values.notna(), None)
+
+    return values.tolist()
+
+
+def _frame_to_costs_info(costs_frame):
+    """Builds CostsInfo straight from the columns of a cost page.
+
+    billed_at strings are converted once per distinct value and additional_info Structs once per
+    distinct combination of values, then copied into each result.
+    """
+    rows = len(costs_frame)
+    columns = {'cost': _column_values(costs_frame, 'cost')}
+
+    for field in _COST_FIELDS:
+        if field in costs_frame.columns:
+            columns[field] = _column_values(costs_frame, field)
+
+    billed_at_strings = {}
+    billed_at_values = []
+    for billed_at in _column_values(costs_frame, 'billed_at'):
+        if billed_at not in billed_at_strings:
+            billed_at_strings[billed_at] = utils.datetime_to_iso8601(billed_at)
+        billed_at_values.append(billed_at_strings[billed_at])
+    columns['billed_at'] = billed_at_values
+
+    additional_info_columns = [column for column in costs_frame.columns if column.startswith('additional_info.')]
+    additional_info_keys = [column.split('.', 1)[1] for column in additional_info_columns]
+    additional_info_values = list(zip(*[_column_values(costs_frame, column) for column in additional_info_columns]))
+    additional_info_templates = {}
+
+    columns['usd_cost'] = columns['cost']
+
+    costs_info = cost_pb2.CostsInfo()
+    results = costs_info.results
+    costs_info_list = [results.add() for _ in range(rows)]
+
+    # Fields are set column by column on the added messages, without building a dict for each row.
+    for field, values in columns.items():
+        for cost_info, value in zip(costs_info_list, values):
+            if value is not None:
+                setattr(cost_info, field, value)
+
+    if additional_info_columns:
+        for cost_info, additional_info in zip(costs_info_list, additional_info_values):
+            if additional_info not in additional_info_templates:
+                additional_info_templates[additional_info] = change_struct_type(
+                    dict(zip(additional_info_keys, additional_info)))
+
+            cost_info.additional_info.CopyFrom(additional_info_templates[additional_info])
+
+    _LOGGER.debug(f'[CostsInfo] rows: {rows}, additional_info templates: {len(additional_info_templates)}')
+    return costs_info
+
+
 def CostsInfo(costs_data, **kwargs):
+    if isinstance(costs_data, pd.DataFrame):
+        return _frame_to_costs_info(costs_data)
+
     return cost_pb2.CostsInfo(results=list(map(functools.partial(CostInfo, **kwargs), costs_data)))
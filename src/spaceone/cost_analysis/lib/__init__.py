@@ -0,0 +1 @@
+from spaceone.cost_analysis.lib.metrics import *
@@ -0,0 +1,167 @@
+import io
+import json
+import logging
+import resource
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+__all__ = ['StreamMetrics', 'MeasuredReader']
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StreamMetrics:
+    """Per-stage timing and throughput of one Job.get_tasks or Cost.get_data call.
+
+    Stage times are exclusive: while a nested stage runs on the same thread, the outer stage is paused.
+    So with parse wrapping download, parse only counts CPU time spent parsing. Months are measured on
+    whichever thread fetches them. At the end of the call, a structured summary is logged.
+    """
+
+    def __init__(self, operation, organization=None, sub_billing_account=None):
+        self.operation = operation
+        self.organization = organization or ''
+        self.sub_billing_account = sub_billing_account or ''
+        self.started_at = time.perf_counter()
+        self.first_yield_at = None
+        self.stages = defaultdict(lambda: defaultdict(float))
+        self.download_bytes = defaultdict(int)
+        self.rows = defaultdict(int)
+        self.pages = defaultdict(int)
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def measure(self, stage, month=None):
+        self._enter(stage, month)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def measure_iter(self, iterable, stage, month=None):
+        iterator = iter(iterable)
+        while True:
+            self._enter(stage, month)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+
+            yield item
+
+    def add_download_bytes(self, month, size):
+        month = month or self.get_current_month()
+        with self.lock:
+            self.download_bytes[month] += size
+
+    def add_page(self, month, rows):
+        if self.first_yield_at is None:
+            self.first_yield_at = time.perf_counter()
+
+        with self.lock:
+            self.rows[month] += rows
+            self.pages[month] += 1
+
+    def add_time(self, stage, month, seconds):
+        with self.lock:
+            self.stages[month][stage] += seconds
+
+    def log_summary(self, **extra):
+        summary = {**self.get_summary(), **extra}
+        _LOGGER.info(f'[{self.operation}] metrics: {json.dumps(summary)}')
+        return summary
+
+    def get_summary(self):
+        with self.lock:
+            months = sorted(set(self.stages) | set(self.download_bytes) | set(self.rows), key=str)
+            summary = {
+                'operation': self.operation,
+                'organization': self.organization,
+                'sub_billing_account': self.sub_billing_account,
+                'elapsed': round(time.perf_counter() - self.started_at, 3),
+                'time_to_first_yield': round(self.first_yield_at - self.started_at, 3)
+                if self.first_yield_at else None,
+                'rows': sum(self.rows.values()),
+                'pages': sum(self.pages.values()),
+                'peak_memory_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                'stages': {},
+                'months': {}
+            }
+
+            for month in months:
+                stages = {stage: round(seconds, 3) for stage, seconds in self.stages[month].items()}
+                for stage, seconds in self.stages[month].items():
+                    summary['stages'][stage] = round(summary['stages'].get(stage, 0) + seconds, 3)
+
+                if month is None:
+                    continue
+
+                month_summary = {'stages': stages, 'rows': self.rows[month], 'pages': self.pages[month]}
+                if self.pages[month]:
+                    month_summary['rows_per_page'] = round(self.rows[month] / self.pages[month], 1)
+
+                if download_bytes := self.download_bytes[month]:
+                    download_seconds = self.stages[month].get('download', 0)
+                    month_summary['download_bytes'] = download_bytes
+                    month_summary['download_bytes_per_sec'] = round(download_bytes / download_seconds) \
+                        if download_seconds else None
+
+                summary['months'][month] = month_summary
+
+        return summary
+
+    def get_current_month(self):
+        stack = self._get_stack()
+        return stack[-1][1] if stack else None
+
+    def _enter(self, stage, month):
+        now = time.perf_counter()
+        stack = self._get_stack()
+        if stack:
+            self._add_time(stack[-1], now)
+            # Nested stages belong to the month of the enclosing stage unless given.
+            month = month or stack[-1][1]
+
+        stack.append([stage, month, now])
+
+    def _exit(self):
+        now = time.perf_counter()
+        stack = self._get_stack()
+        self._add_time(stack.pop(), now)
+
+        if stack:
+            stack[-1][2] = now
+
+    def _add_time(self, frame, now):
+        stage, month, started_at = frame
+        self.add_time(stage, month, now - started_at)
+
+    def _get_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+
+        return self._local.stack
+
+
+class MeasuredReader(io.RawIOBase):
+    """Readable file that records the time and bytes of each read of `reader` as the download stage."""
+
+    def __init__(self, reader, metrics: StreamMetrics, month=None):
+        self.reader = reader
+        self.metrics = metrics
+        self.month = month
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        with self.metrics.measure('download', self.month):
+            size = self.reader.readinto(buffer)
+
+        self.metrics.add_download_bytes(self.month, size or 0)
+        return size
@@ -1,3 +1,4 @@
 from spaceone.cost_analysis.manager.data_source_manager import DataSourceManager
 from spaceone.cost_analysis.manager.job_manager import JobManager
+from spaceone.cost_analysis.manager.exchange_rate_manager import ExchangeRateManager
 from spaceone.cost_analysis.manager.cost_manager import CostManager
@@ -1,17 +1,146 @@
-import logging
+import gzip
 import io
-import pandas as pd
+import logging
+import mmap
+import os
+import queue
+import re
+import tempfile
+import threading
 import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta
 from dateutil import rrule
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 from spaceone.core.manager import BaseManager
 from spaceone.cost_analysis.error import *
-from spaceone.cost_analysis.connector import GoogleStorageConnector
+from spaceone.cost_analysis.connector import GoogleStorageConnector, AsyncGoogleStorageConnector, \
+    CostCacheConnector
+from spaceone.cost_analysis.model.billing_schema import MZC_BILLING_SCHEMA, select_billing_files
+from spaceone.cost_analysis.lib.metrics import StreamMetrics, MeasuredReader
+from spaceone.cost_analysis.manager.exchange_rate_manager import ExchangeRateManager, ExchangeRateTable
 
 _LOGGER = logging.getLogger(__name__)
 
 _PAGE_SIZE = 2000
+_HEADER_PEEK_SIZE = 64 * 1024
+_ARROW_BLOCK_SIZE = 4 * 1024 * 1024
+_DEFAULT_MAX_PAGE_BYTES = 2 * 1024 * 1024
+# Upper bounds of the protobuf encoding overhead: tag + length varint of a field,
+# a double field, a CostsInfo.results entry and an additional_info Struct entry.
+_FIELD_OVERHEAD = 4
+_DOUBLE_FIELD_SIZE = 9
+_RESULT_OVERHEAD = 4
+_STRUCT_ENTRY_OVERHEAD = 12
+_READ_CHUNK_SIZE = 8 * 1024 * 1024
+_DEFAULT_PARALLEL_DOWNLOAD_THRESHOLD_MB = 64
+_DEFAULT_DOWNLOAD_WORKERS = 4
+_DEFAULT_DOWNLOAD_RANGE_SIZE_MB = 16
+_MMAP_RELEASE_SIZE = 64 * 1024 * 1024
+_AGGREGATION_COMBINE_ROWS = 100000
+_DEFAULT_PREFETCH_MONTHS = 2
+_DEFAULT_PREFETCH_PAGES = 10
+_PREFETCH_POLL_INTERVAL = 0.5
+_END_OF_MONTH = object()
+# Leading calendar date of a usage date, before any time or UTC offset.
+_USAGE_DATE_PATTERN = re.compile(r'\s*(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?!\d)')
+_CURRENCY_DTYPE = pd.CategoricalDtype(['USD'])
+_PROVIDER_DTYPE = pd.CategoricalDtype(['google_cloud'])
+
+
+class CategoryDictionary:
+    """Categories of the billing dimensions shared by every page of a get_data call.
+
+    Pages are recoded to the shared categories, so each distinct product, SKU or project name is held
+    once however many pages are buffered. Categories are only appended, which keeps the codes of earlier
+    pages valid while the dictionary grows.
+    """
+
+    def __init__(self):
+        self.dtypes = {}
+        self.lock = threading.Lock()
+
+    def intern(self, data_frame):
+        for column in data_frame.columns:
+            values = data_frame[column]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                continue
+
+            dtype = self._add_categories(column, values.cat.categories)
+            codes = np.append(dtype.categories.get_indexer(values.cat.categories), -1)[values.cat.codes]
+            data_frame[column] = pd.Categorical.from_codes(codes, dtype=dtype)
+
+        return data_frame
+
+    def _add_categories(self, column, categories):
+        with self.lock:
+            dtype = self.dtypes.get(column)
+            if dtype is None:
+                dtype = self.dtypes[column] = pd.CategoricalDtype(categories)
+            elif len(new_categories := categories.difference(dtype.categories, sort=False)):
+                dtype = self.dtypes[column] = pd.CategoricalDtype(dtype.categories.append(new_categories))
+
+            return dtype
+
+    @staticmethod
+    def get_latest_dtype(dtypes):
+        return max(dtypes, key=lambda dtype: len(dtype.categories))
+
+    @staticmethod
+    def recode(values, dtype):
+        return pd.Categorical.from_codes(values.cat.codes, dtype=dtype)
+
+
+class _MmapReader(io.RawIOBase):
+    """Sequential reader of a memory-mapped spill file.
+
+    The pages already read are released every 64MB, so the resident memory of a task stays
+    bounded while a large file is parsed.
+    """
+
+    def __init__(self, spill_map: mmap.mmap):
+        self.spill_map = spill_map
+        self.view = memoryview(spill_map)
+        self.position = 0
+        self.released = 0
+
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            spill_map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self.view) - self.position)
+        buffer[:size] = self.view[self.position:self.position + size]
+        self.position += size
+
+        if hasattr(mmap, 'MADV_DONTNEED') and self.position - self.released >= _MMAP_RELEASE_SIZE:
+            release_end = self.position - self.position % mmap.PAGESIZE
+            self.spill_map.madvise(mmap.MADV_DONTNEED, self.released, release_end - self.released)
+            self.released = release_end
+
+        return size
+
+    def close(self):
+        # The memory map can only be closed once no view of it is left.
+        self.view.release()
+        super().close()
 
 
 class CostManager(BaseManager):
@@ -19,48 +148,335 @@ class CostManager(BaseManager):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.google_storage_connector: GoogleStorageConnector = self.locator.get_connector(GoogleStorageConnector)
+        self.cost_cache_connector: CostCacheConnector = self.locator.get_connector(CostCacheConnector)
+        self.exchange_rate_mgr: ExchangeRateManager = self.locator.get_manager(ExchangeRateManager)
         self.bucket = None
+        self.parse_engine = 'pandas'
+        self.parallel_download_threshold = 0
+        self.download_workers = _DEFAULT_DOWNLOAD_WORKERS
+        self.download_range_size = _DEFAULT_DOWNLOAD_RANGE_SIZE_MB * 1024 * 1024
+        self.spill_to_disk = False
+        self.spill_dir = None
+        self.aggregate = False
+        self.granularity = 'MONTHLY'
+        self.start_date = None
+        self.end_date = None
+        self.metrics = StreamMetrics('get_data')
 
     def get_data(self, options, secret_data, schema, task_options):
+        if AsyncGoogleStorageConnector.is_enabled(options):
+            self.google_storage_connector = self.locator.get_connector(AsyncGoogleStorageConnector)
+
         self.google_storage_connector.create_session(options, secret_data, schema)
+        self.cost_cache_connector.create_session(options)
         self._check_task_options(task_options)
         self.bucket = task_options['bucket']
 
         start = task_options['start']
         organization = task_options['organization']
         sub_billing_account = task_options['sub_billing_account']
+        self.metrics = StreamMetrics('get_data', organization, sub_billing_account)
 
-        exchange_rate_data = self._get_exchange_rate_data()
+        with self.metrics.measure('exchange_rate'):
+            exchange_rate_table = self.exchange_rate_mgr.get_exchange_rate_table(options, secret_data, schema,
+                                                                                 self.bucket)
 
-        folders_info = self.google_storage_connector.list_objects(self.bucket)
-        folder_names = [folder_info['name'] for folder_info in folders_info]
+        with self.metrics.measure('list'):
+            folders_info = self.google_storage_connector.list_objects(
+                self.bucket, prefix=f'{organization}/{sub_billing_account}/'
+            )
+            objects_info = {folder_info['name']: folder_info for folder_info in folders_info}
+        folder_names = list(objects_info.keys())
 
-        exist_cost_data = False
-        date_ranges = self._get_date_range(start)
+        date_ranges = self._get_date_range(start, task_options.get('end'))
         _LOGGER.debug(f'[get_data] task_options: {task_options} / date ranges: {date_ranges[0]} ~ {date_ranges[-1]})')
 
+        csv_files = {}
         for date in date_ranges:
             year, month = date.split('-')
-            end_date = self._get_end_date(year, month)
-
             folder_path = f'{organization}/{sub_billing_account}/{year}/{month}/'
             if csv_file := self._get_csv_file_path(folder_path, folder_names):
-                exist_cost_data = True
+                csv_files[date] = objects_info[csv_file]
+            else:
+                csv_files[date] = None
 
-                blob = self.google_storage_connector.get_blob(self.bucket, csv_file)
-                response_stream = self._get_cost_data(data=blob.download_as_bytes(),
-                                                      target_file=csv_file)
-                krw = self._set_exchange_rate(exchange_rate_data, year, month)
+        if not any(csv_files.values()):
+            _LOGGER.debug(
+                f'[get_data] There is no cost data in {self.bucket}/{organization}/{sub_billing_account} folder.'
+            )
 
-                for results in response_stream:
-                    yield self._make_cost_data(results, end_date, krw)
+        prefetch_months = int(options.get('prefetch_months', _DEFAULT_PREFETCH_MONTHS))
+        prefetch_pages = int(options.get('prefetch_pages', _DEFAULT_PREFETCH_PAGES))
+        max_page_bytes = int(options.get('max_page_bytes', _DEFAULT_MAX_PAGE_BYTES))
+        self.parse_engine = self._get_parse_engine(options)
+        self.parallel_download_threshold = int(options.get('parallel_download_threshold_mb',
+                                                           _DEFAULT_PARALLEL_DOWNLOAD_THRESHOLD_MB)) * 1024 * 1024
+        self.download_workers = int(options.get('download_workers', _DEFAULT_DOWNLOAD_WORKERS))
+        self.download_range_size = int(options.get('download_range_size_mb',
+                                                   _DEFAULT_DOWNLOAD_RANGE_SIZE_MB)) * 1024 * 1024
+        self.spill_to_disk = options.get('spill_to_disk', False)
+        self.spill_dir = options.get('spill_dir')
+        self.aggregate = options.get('aggregate', False)
+        self.granularity = options.get('granularity', 'MONTHLY')
+        self.start_date = datetime.strptime(start, '%Y-%m-%d')
+        self.end_date = datetime.strptime(task_options['end'], '%Y-%m-%d') if task_options.get('end') else None
+        category_dictionary = CategoryDictionary()
+
+        month_index = 0
+        try:
+            for costs_data in self._prefetch_months(
+                date_ranges,
+                lambda date: self._get_month_cost_data(date, csv_files[date], exchange_rate_table, max_page_bytes,
+                                                       category_dictionary),
+                prefetch_months,
+                prefetch_pages
+            ):
+                month = date_ranges[month_index]
+                # Each month ends with an empty list. Pages of a header-only file are empty DataFrames.
+                if isinstance(costs_data, list):
+                    month_index += 1
+                else:
+                    self.metrics.add_page(month, len(costs_data))
+
+                # Time the consumer takes before asking for the next page: protobuf build and send.
+                with self.metrics.measure('serialize', month):
+                    yield costs_data
+        finally:
+            self.metrics.log_summary()
 
-            yield []
+    @staticmethod
+    def _get_parse_engine(options):
+        parse_engine = options.get('parse_engine', 'pandas')
+        if parse_engine == 'pyarrow' and pa is None:
+            _LOGGER.warning('[get_data] pyarrow is not installed. The pandas parse engine is used instead.')
+            return 'pandas'
 
-        if not exist_cost_data:
-            _LOGGER.debug(
-                f'[get_data] There is no cost data in {self.bucket}/{organization}/{sub_billing_account} folder.'
+        return parse_engine
+
+    def _get_month_cost_data(self, date, csv_file_info, exchange_rate_table: ExchangeRateTable, max_page_bytes,
+                             category_dictionary=None):
+        if csv_file_info:
+            year, month = date.split('-')
+            billed_at = datetime.strptime(self._get_end_date(year, month), '%Y-%m-%d')
+
+            csv_file = csv_file_info['name']
+            blob = self.google_storage_connector.get_blob(self.bucket, csv_file, csv_file_info.get('generation'))
+            response_stream = self.metrics.measure_iter(
+                self._get_cost_data(blob=blob, target_file=csv_file, generation=csv_file_info.get('generation'),
+                                    object_info=csv_file_info),
+                'parse', date
             )
+            krw = exchange_rate_table.get_rate(year, month)
+
+            category_dictionary = category_dictionary or CategoryDictionary()
+            response_stream = map(category_dictionary.intern, response_stream)
+
+            costs_stream = self.metrics.measure_iter(
+                (self._make_cost_data(data_frame, billed_at, krw, self.granularity == 'DAILY')
+                 for data_frame in response_stream), 'build', date
+            )
+
+            if self.granularity == 'DAILY':
+                costs_stream = self._filter_task_days(costs_stream)
+
+            if self.aggregate:
+                costs_stream = self.metrics.measure_iter(self._aggregate_costs(costs_stream), 'aggregate', date)
+
+            if max_page_bytes > 0:
+                yield from self.metrics.measure_iter(self._paginate_by_size(costs_stream, max_page_bytes),
+                                                     'paginate', date)
+            elif self.aggregate:
+                for costs_data in costs_stream:
+                    for offset in range(0, len(costs_data), _PAGE_SIZE):
+                        yield costs_data.iloc[offset:offset + _PAGE_SIZE]
+            else:
+                yield from costs_stream
+
+        yield []
+
+    def _filter_task_days(self, costs_stream):
+        """Drop the days outside of the task, whose start may be in the middle of a month with daily granularity."""
+        for costs_data in costs_stream:
+            in_task = costs_data['billed_at'] >= self.start_date
+            if self.end_date:
+                in_task &= costs_data['billed_at'] <= self.end_date
+
+            if in_task.all():
+                yield costs_data
+            elif in_task.any():
+                yield costs_data[in_task.values]
+
+    def _aggregate_costs(self, costs_stream):
+        """Sum the cost of the rows of a month that share every other column.
+
+        This leaves one row per product, usage type, account, project and sub billing account. Pages are
+        summed as they arrive, and the partial sums are combined whenever they grow large, so memory is
+        bounded by the number of distinct rows instead of the size of the month.
+        """
+        partial_sums = []
+        partial_rows = 0
+        combine_rows = _AGGREGATION_COMBINE_ROWS
+
+        for costs_data in costs_stream:
+            partial_sums.append(self._sum_costs(costs_data))
+            partial_rows += len(partial_sums[-1])
+
+            if partial_rows > combine_rows and len(partial_sums) > 1:
+                partial_sums = [self._sum_costs(self._concat_pages(partial_sums))]
+                partial_rows = len(partial_sums[0])
+                combine_rows = max(_AGGREGATION_COMBINE_ROWS, partial_rows * 2)
+
+        if len(partial_sums) > 1:
+            yield self._sum_costs(self._concat_pages(partial_sums))
+        elif partial_sums:
+            yield partial_sums[0]
+
+    @staticmethod
+    def _sum_costs(costs_data):
+        keys = [column for column in costs_data.columns if column != 'cost']
+        summed = costs_data.groupby(keys, observed=True, dropna=False, sort=False, as_index=False)['cost'].sum()
+        return summed[costs_data.columns]
+
+    def _paginate_by_size(self, costs_stream, max_page_bytes):
+        """Regroup cost frames into pages whose encoded CostsInfo size stays within `max_page_bytes`.
+
+        A row that is larger than the budget on its own is sent as a page of one row.
+        """
+        pending_frames = []
+        pending_bytes = 0
+
+        for costs_data in costs_stream:
+            encoded_sizes = np.cumsum(self._get_encoded_sizes(costs_data))
+            offset = 0
+
+            while offset < len(costs_data):
+                base = encoded_sizes[offset - 1] if offset else 0
+                end = int(np.searchsorted(encoded_sizes, base + max_page_bytes - pending_bytes, side='right'))
+
+                if end == offset:
+                    if pending_frames:
+                        yield self._concat_pages(pending_frames)
+                        pending_frames = []
+                        pending_bytes = 0
+                        continue
+
+                    end = offset + 1
+
+                pending_frames.append(costs_data.iloc[offset:end])
+                pending_bytes += encoded_sizes[end - 1] - base
+                offset = end
+
+                if offset < len(costs_data):
+                    yield self._concat_pages(pending_frames)
+                    pending_frames = []
+                    pending_bytes = 0
+
+        if pending_frames:
+            yield self._concat_pages(pending_frames)
+
+    @staticmethod
+    def _concat_pages(frames):
+        """Concatenate frames without losing categorical columns that were interned at different dictionary sizes."""
+        if len(frames) == 1:
+            return frames[0]
+
+        for column in frames[0].columns:
+            dtypes = [frame[column].dtype for frame in frames]
+            if isinstance(dtypes[0], pd.CategoricalDtype) and any(dtype is not dtypes[0] for dtype in dtypes):
+                dtype = CategoryDictionary.get_latest_dtype(dtypes)
+                frames = [frame.assign(**{column: CategoryDictionary.recode(frame[column], dtype)})
+                          for frame in frames]
+
+        return pd.concat(frames)
+
+    @staticmethod
+    def _get_encoded_sizes(costs_data):
+        """Upper bound of the encoded size of each row as a CostsInfo result."""
+        encoded_sizes = np.full(len(costs_data), 2 * _DOUBLE_FIELD_SIZE + _RESULT_OVERHEAD, dtype=np.int64)
+
+        for column in costs_data.columns:
+            if column == 'cost':
+                continue
+
+            values = costs_data[column]
+            if column.startswith('additional_info.'):
+                key_length = len(column.split('.', 1)[1].encode('utf-8'))
+                encoded_sizes += CostManager._get_byte_lengths(values) + key_length + _STRUCT_ENTRY_OVERHEAD
+            elif pd.api.types.is_numeric_dtype(values):
+                encoded_sizes += _DOUBLE_FIELD_SIZE
+            elif pd.api.types.is_datetime64_any_dtype(values):
+                encoded_sizes += len('0000-00-00T00:00:00.000Z') + _FIELD_OVERHEAD
+            else:
+                encoded_sizes += CostManager._get_byte_lengths(values) + _FIELD_OVERHEAD
+
+        return encoded_sizes
+
+    @staticmethod
+    def _get_byte_lengths(values):
+        codes, uniques = pd.factorize(values)
+        byte_lengths = np.array([len(str(value).encode('utf-8')) for value in uniques] + [0], dtype=np.int64)
+        return byte_lengths[codes]
+
+    @staticmethod
+    def _prefetch_months(date_ranges, get_month_data, prefetch_months, prefetch_pages):
+        """Yield the pages of each month in order while the next months are fetched in the background.
+
+        At most `prefetch_months` months are in flight at once and each of them buffers at most
+        `prefetch_pages` pages, so prefetch memory is capped at prefetch_months * prefetch_pages pages.
+        """
+        if prefetch_months <= 0:
+            for date in date_ranges:
+                yield from get_month_data(date)
+            return
+
+        stop_event = threading.Event()
+
+        def _put(page_queue, item):
+            while not stop_event.is_set():
+                try:
+                    page_queue.put(item, timeout=_PREFETCH_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _fetch_month(date, page_queue):
+            try:
+                for page in get_month_data(date):
+                    if not _put(page_queue, page):
+                        return
+            except Exception as e:
+                _put(page_queue, e)
+            finally:
+                _put(page_queue, _END_OF_MONTH)
+
+        executor = ThreadPoolExecutor(max_workers=prefetch_months, thread_name_prefix='cost-prefetch')
+        page_queues = []
+
+        def _submit(date):
+            page_queue = queue.Queue(maxsize=max(prefetch_pages, 1))
+            executor.submit(_fetch_month, date, page_queue)
+            page_queues.append(page_queue)
+
+        try:
+            for date in date_ranges[:prefetch_months]:
+                _submit(date)
+
+            for index in range(len(date_ranges)):
+                page_queue = page_queues[index]
+
+                while (page := page_queue.get()) is not _END_OF_MONTH:
+                    if isinstance(page, Exception):
+                        raise page
+
+                    yield page
+
+                page_queues[index] = None
+                if index + prefetch_months < len(date_ranges):
+                    _submit(date_ranges[index + prefetch_months])
+        finally:
+            stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
 
     @staticmethod
     def _check_task_options(task_options):
@@ -76,27 +492,12 @@ class CostManager(BaseManager):
         if 'sub_billing_account' not in task_options:
             raise ERROR_REQUIRED_PARAMETER(key='task_options.sub_billing_account')
 
-    def _get_exchange_rate_data(self):
-        exchange_path = 'settings/exchange_rate.csv'
-        try:
-            blob = self.google_storage_connector.get_blob(self.bucket, exchange_path)
-            data_frame = pd.read_csv(io.BytesIO(blob.download_as_bytes()))
-            data_frame = data_frame.replace({np.nan: None})
-            data_frame['year'].astype(int)
-            data_frame['month'].astype(int)
-            exchange_rate_data = data_frame.to_dict('records')
-        except Exception as e:
-            _LOGGER.error(f'[_get_exchange_rate_data] {e}')
-            raise ERROR_EXCHANGE_RATE_DATA_NOT_FOUND()
-
-        return exchange_rate_data
-
     @staticmethod
-    def _get_date_range(start):
+    def _get_date_range(start, end=None):
         date_ranges = []
-        start_time = datetime.strptime(start, '%Y-%m-%d')
-        now = datetime.utcnow()
-        for dt in rrule.rrule(rrule.MONTHLY, dtstart=start_time, until=now):
+        start_time = datetime.strptime(start, '%Y-%m-%d').replace(day=1)
+        end_time = datetime.strptime(end, '%Y-%m-%d') if end else datetime.utcnow()
+        for dt in rrule.rrule(rrule.MONTHLY, dtstart=start_time, until=end_time):
             billed_month = dt.strftime('%Y-%m')
             date_ranges.append(billed_month)
 
@@ -108,22 +509,9 @@ class CostManager(BaseManager):
         end_date = next_month - timedelta(days=1)
         return end_date.strftime('%Y-%m-%d')
 
-    @staticmethod
-    def _set_exchange_rate(exchange_rate_data, year, month):
-        krw = 0
-        for exchange_rate in exchange_rate_data:
-            if exchange_rate['year'] == int(year) and exchange_rate['month'] == int(month):
-                krw = int(exchange_rate['KRW'])
-                break
-        if not krw:
-            raise ERROR_NOT_FOUND_EXCHANGE_RATE(year=year, month=month)
-        return krw
-
     def _get_csv_file_path(self, folder_path, folder_names):
-        csv_files = [
-            file_name for file_name in folder_names
-            if file_name.startswith(folder_path) and file_name.endswith('.csv')
-        ]
+        # A folder may hold the same export in several formats, only duplicates of one format are ambiguous.
+        csv_files = select_billing_files(file_name for file_name in folder_names if file_name.startswith(folder_path))
 
         if len(csv_files) > 1:
             raise ERROR_TOO_MANY_CSV_FILES(target_dir=csv_files)
@@ -133,62 +521,288 @@ class CostManager(BaseManager):
         else:
             return csv_files[0]
 
-    def _get_cost_data(self, data, target_file):
-        data_frame = pd.read_csv(io.BytesIO(data))
-        data_frame = data_frame.replace({np.nan: None})
+    def _get_cost_data(self, blob, target_file, generation=None, object_info=None):
+        if not self.cost_cache_connector.is_cacheable(generation):
+            yield from self._parse_cost_data(blob, target_file, object_info)
+            return
+
+        if cached_stream := self.cost_cache_connector.read(self.bucket, target_file, generation):
+            _LOGGER.debug(f'[get_cost_data] read from cache: {target_file} (generation: {generation})')
+            yield from cached_stream
+            return
+
+        # A read that is not pinned to the generation may return a newer version of the object,
+        # which must not be cached under the key of this one.
+        if not self._is_pinned_read(blob, target_file, generation, object_info):
+            yield from self._parse_cost_data(blob, target_file, object_info)
+            return
+
+        with self.cost_cache_connector.writer(self.bucket, target_file, generation) as cache_writer:
+            for data_frame in self._parse_cost_data(blob, target_file, object_info):
+                cache_writer.write(data_frame)
+                yield data_frame
+
+    def _is_pinned_read(self, blob, target_file, generation, object_info=None):
+        if object_info and (self._is_spilled(object_info) or target_file.endswith('.parquet')):
+            # Spill files are downloaded with the generation of object_info.
+            return str(object_info.get('generation')) == str(generation)
+
+        return str(getattr(blob, 'generation', None)) == str(generation)
+
+    def _parse_cost_data(self, blob, target_file, object_info=None):
+        if target_file.endswith('.parquet'):
+            yield from self._parse_parquet_cost_data(blob, target_file, object_info)
+            return
+
+        costs_count = 0
+
+        # Read the object in ranged chunks and parse one page at a time,
+        # so memory is bounded by the page size instead of the file size.
+        with self._open_billing_file(blob, object_info) as blob_reader, \
+                self._decompress(blob_reader, target_file, object_info) as billing_file:
+            csv_file = io.BufferedReader(billing_file, buffer_size=_HEADER_PEEK_SIZE)
+            columns = self._get_cost_columns(csv_file, target_file)
+
+            if self.parse_engine == 'pyarrow':
+                response_stream = self._read_csv_with_pyarrow(csv_file, columns)
+            else:
+                response_stream = self._read_csv_with_pandas(csv_file, columns)
+
+            for data_frame in response_stream:
+                costs_count += len(data_frame)
+                yield data_frame
+
+        _LOGGER.debug(f'[parse_cost_data] costs count({target_file}): {costs_count}')
 
-        data_frame = self._apply_strip_to_columns(data_frame)
-        costs_data = data_frame.to_dict('records')
+    def _parse_parquet_cost_data(self, blob, target_file, object_info=None):
+        if pa is None:
+            raise ERROR_UNSUPPORTED_BILLING_FILE(target_file=target_file, reason='pyarrow is not installed')
 
-        _LOGGER.debug(f'[get_cost_data] costs count({target_file}): {len(costs_data)}')
+        costs_count = 0
 
-        # Paginate
-        page_count = int(len(costs_data) / _PAGE_SIZE) + 1
+        # Parquet keeps its footer at the end of the file, so the object is downloaded before it is read.
+        # Only the row groups of the schema columns are then decoded, one page at a time.
+        with self._open_parquet_file(blob, object_info) as parquet_source:
+            try:
+                parquet_file = pa_parquet.ParquetFile(parquet_source)
+            except pa.ArrowInvalid as e:
+                raise ERROR_UNSUPPORTED_BILLING_FILE(target_file=target_file, reason=e)
+
+            columns = MZC_BILLING_SCHEMA.resolve_names(parquet_file.schema_arrow.names)
+            if missing_columns := MZC_BILLING_SCHEMA.get_missing_columns(columns):
+                raise ERROR_REQUIRED_BILLING_COLUMN(columns=missing_columns, target_file=target_file)
+
+            # Dictionary encoded string columns are read as dictionaries instead of being decoded per row.
+            parquet_file = pa_parquet.ParquetFile(parquet_source, metadata=parquet_file.metadata, read_dictionary=[
+                column for column, dtype in MZC_BILLING_SCHEMA.get_dtypes(columns).items()
+                if dtype == 'category' and pa.types.is_string(parquet_file.schema_arrow.field(column).type)
+            ])
+
+            for record_batch in parquet_file.iter_batches(batch_size=_PAGE_SIZE, columns=list(columns)):
+                data_frame = self._convert_record_batch(record_batch, columns)
+                costs_count += len(data_frame)
+                yield data_frame
+
+        _LOGGER.debug(f'[parse_parquet_cost_data] costs count({target_file}): {costs_count}')
+
+    @contextmanager
+    def _open_billing_file(self, blob, object_info=None):
+        """Opens a billing file for reading.
+
+        With `spill_to_disk`, or above `parallel_download_threshold_mb`, the object is first downloaded to a
+        spill file as byte ranges fetched in parallel and parsed from a memory map of it. Otherwise it is
+        streamed from GCS while it is parsed.
+        """
+        if not (object_info and self._is_spilled(object_info)):
+            with blob.open('rb', chunk_size=_READ_CHUNK_SIZE, raw_download=True) as blob_reader:
+                yield MeasuredReader(blob_reader, self.metrics)
+            return
+
+        with self._download_spill_file(object_info) as spill_path, open(spill_path, 'rb') as spill_file:
+            if int(object_info['size']) == 0:
+                yield spill_file
+                return
+
+            with mmap.mmap(spill_file.fileno(), 0, access=mmap.ACCESS_READ) as spill_map, \
+                    _MmapReader(spill_map) as spill_reader:
+                yield spill_reader
+
+    @contextmanager
+    def _open_parquet_file(self, blob, object_info=None):
+        """Opens a Parquet billing file for random access, from a memory map of its spill file."""
+        if not object_info:
+            with blob.open('rb', chunk_size=_READ_CHUNK_SIZE, raw_download=True) as blob_reader:
+                yield pa.BufferReader(MeasuredReader(blob_reader, self.metrics).readall())
+            return
+
+        with self._download_spill_file(object_info) as spill_path, pa.memory_map(spill_path) as parquet_file:
+            yield parquet_file
+
+    @contextmanager
+    def _download_spill_file(self, object_info):
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+        fd, spill_path = tempfile.mkstemp(dir=self.spill_dir, suffix=os.path.splitext(object_info['name'])[1])
+        os.close(fd)
+        try:
+            with self.metrics.measure('download'):
+                self.google_storage_connector.download_to_file(self.bucket, object_info, spill_path,
+                                                               self.download_workers, self.download_range_size)
+                self.metrics.add_download_bytes(None, int(object_info['size']))
 
-        for page_num in range(page_count):
-            offset = _PAGE_SIZE * page_num
-            yield costs_data[offset:offset + _PAGE_SIZE]
+            yield spill_path
+        finally:
+            os.remove(spill_path)
 
     @staticmethod
-    def _apply_strip_to_columns(data_frame):
-        columns = list(data_frame.columns)
-        columns = [column.strip() for column in columns]
-        data_frame.columns = columns
+    def _decompress(billing_file, target_file, object_info=None):
+        """Wraps a compressed billing file in a streaming decompressor. The object is always read as stored."""
+        if target_file.endswith('.gz') or (object_info or {}).get('contentEncoding') == 'gzip':
+            return gzip.GzipFile(fileobj=billing_file, mode='rb')
 
-        if isinstance(data_frame['소계'].values[0], str):
-            data_frame['소계'] = data_frame['소계'].str.replace(',', '')
-            data_frame['소계'] = data_frame['소계'].astype(float)
+        if target_file.endswith('.zst'):
+            if zstandard is None:
+                raise ERROR_UNSUPPORTED_BILLING_FILE(target_file=target_file, reason='zstandard is not installed')
 
-        return data_frame
+            return zstandard.ZstdDecompressor().stream_reader(billing_file)
+
+        return nullcontext(billing_file)
+
+    def _is_spilled(self, object_info):
+        if self.spill_to_disk:
+            return True
+
+        return 0 < self.parallel_download_threshold <= int(object_info.get('size', 0))
 
     @staticmethod
-    def _make_cost_data(results, end_date, krw):
-        costs_data = []
+    def _get_cost_columns(csv_file, target_file):
+        """Returns the raw header names of the billing schema columns, mapped to their stripped names."""
+        header = csv_file.peek(_HEADER_PEEK_SIZE).split(b'\n', 1)[0].decode('utf-8-sig').rstrip('\r')
+        columns = MZC_BILLING_SCHEMA.resolve_columns(header)
 
-        for result in results:
-            try:
-                data = {
-                    'cost': result['소계'] * (1 / krw),
-                    'currency': 'USD',
-                    # 'usage_quantity': result['Usage'],
-                    'provider': 'google_cloud',
-                    'product': result['Service Name'],
-                    # 'region_code': result.get('Region') if result.get('Region') else 'global',
-                    'account': result.get('Project ID'),
-                    'usage_type': result['SKU Name'],
-                    # 'usage_unit': result['Usage Unit'],
-                    'billed_at': datetime.strptime(end_date, '%Y-%m-%d'),
-                    'additional_info': {
-                        'Project Name': result.get('Project Name'),
-                        'Sub Billing Account Name': result.get('SBA Name')
-                        # 'Cost Type': result.get('Cost Type')
-                    },
+        if missing_columns := MZC_BILLING_SCHEMA.get_missing_columns(columns):
+            raise ERROR_REQUIRED_BILLING_COLUMN(columns=missing_columns, target_file=target_file)
+
+        return columns
+
+    @staticmethod
+    def _read_csv_with_pandas(csv_file, columns):
+        for data_frame in pd.read_csv(csv_file, chunksize=_PAGE_SIZE, usecols=list(columns), thousands=',',
+                                      dtype=MZC_BILLING_SCHEMA.get_dtypes(columns)):
+            yield data_frame.rename(columns=columns)
+
+    @staticmethod
+    def _read_csv_with_pyarrow(csv_file, columns):
+        dtypes = MZC_BILLING_SCHEMA.get_dtypes(columns)
+        reader = pa_csv.open_csv(
+            csv_file,
+            read_options=pa_csv.ReadOptions(use_threads=True, block_size=_ARROW_BLOCK_SIZE),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=list(columns), strings_can_be_null=True,
+                column_types={
+                    column: pa.dictionary(pa.int32(), pa.string()) if dtype == 'category' else pa.string()
+                    for column, dtype in dtypes.items()
                 }
+            )
+        )
 
-            except Exception as e:
-                _LOGGER.error(f'[_make_cost_data] make data error: {e}', exc_info=True)
-                raise e
+        for record_batch in reader:
+            yield CostManager._convert_record_batch(record_batch, columns)
 
-            costs_data.append(data)
+    @staticmethod
+    def _convert_record_batch(record_batch, columns):
+        """Converts a record batch of schema columns to a page with stripped names and the schema dtypes."""
+        dtypes = MZC_BILLING_SCHEMA.get_dtypes(columns)
+        arrays = []
+        for column in record_batch.schema.names:
+            array = record_batch.column(column)
+            if dtypes[column] == 'float64':
+                if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+                    array = pc.replace_substring(array, ',', '')
+                array = pc.cast(array, pa.float64())
+            elif dtypes[column] == 'category':
+                if not pa.types.is_dictionary(array.type):
+                    array = pc.dictionary_encode(pc.cast(array, pa.string()))
+                elif not pa.types.is_string(array.type.value_type):
+                    array = pc.cast(array, pa.dictionary(array.type.index_type, pa.string()))
+            arrays.append(array)
+
+        record_batch = pa.RecordBatch.from_arrays(arrays, names=[columns[column] for column in
+                                                                 record_batch.schema.names])
+        return record_batch.to_pandas()
+
+    @staticmethod
+    def _get_usage_dates(data_frame, billed_at):
+        """Day of each row from its usage start date. Rows without one keep the last day of the month.
+
+        The day is the calendar date written in the value, in its own UTC offset, so a usage date of
+        `2023-01-05T00:00:00+09:00` stays on January 5th. Rows whose date cannot be parsed are logged
+        and also keep the last day of the month.
+        """
+        usage_dates = data_frame.get('Usage Start Date')
+        if usage_dates is None:
+            return billed_at
+
+        if not isinstance(usage_dates.dtype, pd.CategoricalDtype):
+            usage_dates = usage_dates.astype('category')
+
+        # Only the distinct dates are parsed, then taken by the category codes of the rows.
+        categories = usage_dates.cat.categories
+        days = np.array([CostManager._parse_usage_day(value) for value in categories], dtype='datetime64[ns]')
+        codes = usage_dates.cat.codes.values
+
+        if invalid := np.flatnonzero(np.isnat(days)).tolist():
+            invalid_rows = int(np.isin(codes, invalid).sum())
+            _LOGGER.warning(f'[get_usage_dates] {invalid_rows} rows with an invalid usage start date are billed at '
+                            f'{billed_at:%Y-%m-%d}: {[categories[index] for index in invalid[:5]]}')
+
+        days = np.append(days, np.datetime64(billed_at, 'ns'))
+        usage_days = days[codes]
+        return np.where(np.isnat(usage_days), np.datetime64(billed_at, 'ns'), usage_days)
+
+    @staticmethod
+    def _parse_usage_day(value):
+        if isinstance(value, str) and (match := _USAGE_DATE_PATTERN.match(value)):
+            year, month, day = map(int, match.groups())
+            try:
+                return np.datetime64(datetime(year, month, day), 'ns')
+            except ValueError:
+                return np.datetime64('NaT', 'ns')
+
+        try:
+            # Other formats are parsed one by one, so values with different offsets or formats do not conflict.
+            timestamp = pd.Timestamp(value)
+        except (TypeError, ValueError):
+            return np.datetime64('NaT', 'ns')
+
+        if pd.isna(timestamp):
+            return np.datetime64('NaT', 'ns')
+
+        return np.datetime64(datetime.combine(timestamp.date(), datetime.min.time()), 'ns')
+
+    @staticmethod
+    def _make_cost_data(data_frame, billed_at, krw, daily=False):
+        try:
+            constant_codes = np.zeros(len(data_frame), dtype=np.int8)
+            costs_data = pd.DataFrame({
+                'cost': data_frame['소계'] * (1 / krw),
+                'currency': pd.Categorical.from_codes(constant_codes, dtype=_CURRENCY_DTYPE),
+                # 'usage_quantity': data_frame['Usage'],
+                'provider': pd.Categorical.from_codes(constant_codes, dtype=_PROVIDER_DTYPE),
+                'product': data_frame['Service Name'],
+                # 'region_code': data_frame.get('Region'),
+                'account': data_frame.get('Project ID'),
+                'usage_type': data_frame['SKU Name'],
+                # 'usage_unit': data_frame['Usage Unit'],
+                'billed_at': CostManager._get_usage_dates(data_frame, billed_at) if daily else billed_at,
+                'additional_info.Project Name': data_frame.get('Project Name'),
+                'additional_info.Sub Billing Account Name': data_frame.get('SBA Name'),
+                # 'additional_info.Cost Type': data_frame.get('Cost Type'),
+            }, index=data_frame.index)
+
+        except Exception as e:
+            _LOGGER.error(f'[_make_cost_data] make data error: {e}', exc_info=True)
+            raise e
 
         return costs_data
@@ -1,6 +1,7 @@
 import logging
 
 from spaceone.core.manager import BaseManager
+from spaceone.cost_analysis.error import *
 from spaceone.cost_analysis.connector import GoogleStorageConnector
 from spaceone.cost_analysis.model import PluginMetadata
 
@@ -11,6 +12,9 @@ class DataSourceManager(BaseManager):
 
     @staticmethod
     def init_response(options):
+        if options.get('granularity', 'MONTHLY') not in ('MONTHLY', 'DAILY'):
+            raise ERROR_INVALID_PARAMETER(key='options.granularity', reason='MONTHLY or DAILY')
+
         plugin_metadata = PluginMetadata()
         plugin_metadata.validate()
 
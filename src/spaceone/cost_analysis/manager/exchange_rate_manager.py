@@ -0,0 +1,81 @@
+import logging
+import io
+import threading
+import time
+import pandas as pd
+
+from spaceone.core.manager import BaseManager
+from spaceone.cost_analysis.error import *
+from spaceone.cost_analysis.connector import GoogleStorageConnector
+
+_LOGGER = logging.getLogger(__name__)
+
+_EXCHANGE_RATE_PATH = 'settings/exchange_rate.csv'
+_EXCHANGE_RATE_TTL = 600
+
+_EXCHANGE_RATE_TABLES = {}
+_EXCHANGE_RATE_LOCK = threading.Lock()
+
+
+class ExchangeRateTable:
+    """KRW exchange rates of settings/exchange_rate.csv indexed by (year, month)."""
+
+    def __init__(self, data_frame, generation=None):
+        data_frame = data_frame.dropna(subset=['year', 'month', 'KRW'])
+        self.rates = pd.Series(
+            data_frame['KRW'].astype(int).values,
+            index=pd.MultiIndex.from_arrays([data_frame['year'].astype(int), data_frame['month'].astype(int)])
+        )
+        self.rates = self.rates[~self.rates.index.duplicated()]
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+
+    def get_rate(self, year, month):
+        krw = self.rates.get((int(year), int(month)), 0)
+        if not krw:
+            raise ERROR_NOT_FOUND_EXCHANGE_RATE(year=year, month=month)
+
+        return int(krw)
+
+    def is_expired(self):
+        return time.monotonic() - self.loaded_at > _EXCHANGE_RATE_TTL
+
+
+class ExchangeRateManager(BaseManager):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.google_storage_connector: GoogleStorageConnector = self.locator.get_connector(GoogleStorageConnector)
+
+    def get_exchange_rate_table(self, options, secret_data, schema, bucket):
+        """Returns the exchange rate table of the bucket.
+
+        The table is cached per process. After the TTL expires, it is downloaded again
+        only if the generation of the exchange rate file has changed.
+        """
+        with _EXCHANGE_RATE_LOCK:
+            exchange_rate_table = _EXCHANGE_RATE_TABLES.get(bucket)
+
+        if exchange_rate_table and not exchange_rate_table.is_expired():
+            return exchange_rate_table
+
+        self.google_storage_connector.create_session(options, secret_data, schema)
+
+        try:
+            blob = self.google_storage_connector.get_blob(bucket, _EXCHANGE_RATE_PATH)
+            blob.reload()
+
+            if exchange_rate_table and exchange_rate_table.generation == blob.generation:
+                exchange_rate_table.loaded_at = time.monotonic()
+                return exchange_rate_table
+
+            data = blob.download_as_bytes(if_generation_match=blob.generation)
+            exchange_rate_table = ExchangeRateTable(pd.read_csv(io.BytesIO(data)), blob.generation)
+        except Exception as e:
+            _LOGGER.error(f'[get_exchange_rate_table] {e}')
+            raise ERROR_EXCHANGE_RATE_DATA_NOT_FOUND()
+
+        with _EXCHANGE_RATE_LOCK:
+            _EXCHANGE_RATE_TABLES[bucket] = exchange_rate_table
+
+        return exchange_rate_table
@@ -1,59 +1,390 @@
 import logging
 import re
+import time
 from datetime import datetime, timedelta
+from dateutil import parser, tz
 
 from spaceone.core.manager import BaseManager
 from spaceone.cost_analysis.error import *
-from spaceone.cost_analysis.connector import GoogleStorageConnector
-from spaceone.cost_analysis.model import Tasks
+from spaceone.cost_analysis.connector import GoogleStorageConnector, AsyncGoogleStorageConnector, \
+    SyncStateConnector
+from spaceone.cost_analysis.model import Tasks, select_billing_files
+from spaceone.cost_analysis.lib.metrics import StreamMetrics
 
 _LOGGER = logging.getLogger(__name__)
 
+# Objects updated this long before the last synchronization are known to be synchronized already.
+_CHANGE_DETECTION_MARGIN = timedelta(days=1)
+# A task handed out this long after the last synchronization started did not belong to it.
+_SYNC_STATE_TOLERANCE = timedelta(minutes=10)
+_DEFAULT_DAILY_LOOKBACK_DAYS = 3
+_SUB_BILLING_ACCOUNT_ID_PATTERN = r'^[A-Z0-9]{6}-[A-Z0-9]{6}-[A-Z0-9]{6}'
+
 
 class JobManager(BaseManager):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.google_storage_connector: GoogleStorageConnector = self.locator.get_connector(GoogleStorageConnector)
+        self.sync_state_connector: SyncStateConnector = self.locator.get_connector(SyncStateConnector)
 
     def get_tasks(self, options, secret_data, schema, start, last_synchronized_at, domain_id):
 
         tasks = []
         changed = []
 
-        start_time = self._get_start_time(start, last_synchronized_at)
-        start_date = start_time.strftime('%Y-%m-%d')
-        changed_time = start_time
+        if AsyncGoogleStorageConnector.is_enabled(options):
+            self.google_storage_connector = self.locator.get_connector(AsyncGoogleStorageConnector)
+
         self.google_storage_connector.create_session(options, secret_data, schema)
+        self.sync_state_connector.create_session(options)
 
         bucket = secret_data['bucket']
         organization = secret_data['organization']
+        metrics = StreamMetrics('get_tasks', organization)
+        objects_info = []
+
+        if self.google_storage_connector.bucket_exists(bucket):
+            prefix = None if organization == '*' else f'{organization}/'
+            with metrics.measure('list'):
+                if options.get('listing_mode', 'flat') == 'prefix':
+                    objects_info = self._list_billing_objects_by_prefix(bucket, organization)
+                else:
+                    objects_info = self._list_billing_objects(bucket, prefix)
+
+            planned_at = time.perf_counter()
+            folder_paths = [object_info['name'] for object_info in objects_info]
+
+            task_info = self._create_task_info(folder_paths)
+            task_info = self._change_valid_task_info(task_info, organization, bucket)
+            billing_files = self._get_billing_files(objects_info, task_info)
+
+            sync_state = self.sync_state_connector.get_state(domain_id, bucket, organization)
+            now = datetime.utcnow()
+
+            if start or not last_synchronized_at or not options.get('incremental_sync', True):
+                start_time = self._get_start_time(start, last_synchronized_at)
+                accounts = [
+                    (org_in_task_info, sub_billing_account)
+                    for org_in_task_info, sub_billing_accounts in task_info.items()
+                    for sub_billing_account in sub_billing_accounts
+                ]
+                windows = [(start_time, None, accounts)]
+                sync_state = {}
+            else:
+                last_synchronized_at = self._to_utc(last_synchronized_at)
+                scan_month = self._get_start_time(None).strftime('%Y-%m')
+                changed_months = self._get_changed_months(billing_files, sync_state, scan_month,
+                                                          last_synchronized_at)
+                _LOGGER.debug(f'[get_tasks] changed months: {sorted(changed_months)}')
+
+                windows = []
+                for window_start, window_end in self._get_month_windows(changed_months):
+                    months = set(self._get_months(window_start, window_end))
+                    accounts = sorted({
+                        (billing_file['organization'], billing_file['sub_billing_account'])
+                        for billing_file in billing_files.values() if billing_file['month'] in months
+                    })
+                    windows.append((window_start, window_end, accounts))
+
+                if options.get('granularity', 'MONTHLY') == 'DAILY':
+                    lookback_days = int(options.get('daily_lookback_days', _DEFAULT_DAILY_LOOKBACK_DAYS))
+                    windows = self._apply_daily_lookback(windows, billing_files, sync_state, last_synchronized_at,
+                                                         lookback_days)
 
-        for gcs_bucket in self.google_storage_connector.list_buckets():
-            if gcs_bucket['name'] == bucket:
-                folders_info = self.google_storage_connector.list_objects(bucket)
-                folder_paths = [folder_info['name'] for folder_info in folders_info]
-
-                task_info = self._create_task_info(folder_paths)
-                task_info = self._change_valid_task_info(task_info, organization, bucket)
-
-                for organization, sub_billing_accounts in task_info.items():
-                    for sub_billing_account in sub_billing_accounts:
-                        tasks.append({
-                            'task_options': {
-                                'bucket': bucket,
-                                'organization': organization,
-                                'sub_billing_account': sub_billing_account,
-                                'start': start_date
-                            }
-                        })
-                        changed.append({'start': changed_time})
+            max_months = int(options.get('max_months_per_task', 0))
+            max_size = int(options.get('max_task_size_mb', 0)) * 1024 * 1024
+            month_sizes = self._get_month_sizes(billing_files)
+            sized_tasks = []
+
+            for window_start, window_end, accounts in windows:
+                for org_in_task_info, sub_billing_account in accounts:
+                    account_month_sizes = month_sizes.get((org_in_task_info, sub_billing_account), {})
+                    for range_start, range_end, range_size in self._get_task_ranges(window_start, window_end,
+                                                                                   account_month_sizes,
+                                                                                   max_months, max_size):
+                        sized_tasks.append((range_size, self._make_task(bucket, org_in_task_info,
+                                                                        sub_billing_account, range_start,
+                                                                        range_end)))
+
+                if accounts or window_end:
+                    changed.append({'start': window_start, 'end': window_end})
+
+            # Largest tasks first, so that they do not end up at the tail of the job
+            if max_size:
+                sized_tasks.sort(key=lambda sized_task: sized_task[0], reverse=True)
+
+            tasks = [task for _, task in sized_tasks]
+
+            self.sync_state_connector.update_state(domain_id, bucket, organization,
+                                                   self._make_sync_state(billing_files, sync_state, now))
+            metrics.add_time('plan', None, time.perf_counter() - planned_at)
+        else:
+            _LOGGER.debug(f'[get_tasks] bucket not found: {bucket}')
+
+        metrics.log_summary(objects=len(objects_info), tasks=len(tasks))
 
         tasks = Tasks({'tasks': tasks, 'changed': changed})
         tasks.validate()
         _LOGGER.debug(f'[get_tasks] create JobTasks: {tasks.to_primitive()}')
         return tasks.to_primitive()
 
+    def _list_billing_objects(self, bucket, prefix):
+        if not isinstance(self.google_storage_connector, AsyncGoogleStorageConnector):
+            return list(self.google_storage_connector.list_objects(bucket, prefix=prefix))
+
+        # List the folders under the prefix, then every folder concurrently on the event loop
+        top_level = self.google_storage_connector.list_objects_concurrently(bucket, [prefix], delimiter='/')[prefix]
+        folders = self.google_storage_connector.list_objects_concurrently(bucket, top_level['prefixes'])
+
+        objects_info = list(top_level['items'])
+        for folder in top_level['prefixes']:
+            objects_info.extend(folders[folder]['items'])
+
+        return objects_info
+
+    def _list_billing_objects_by_prefix(self, bucket, organization):
+        """Lists the objects of every sub billing account folder, discovered with delimiter listings.
+
+        The organization folders are listed first, then their sub billing account folders, then the month
+        folders of every valid account, each level concurrently. Folders that are not sub billing accounts
+        are never listed, and each account costs one listing request however large the bucket is.
+        """
+        if organization == '*':
+            organization_prefixes = list(self.google_storage_connector.list_prefixes(bucket, delimiter='/'))
+        else:
+            organization_prefixes = [f'{organization}/']
+
+        organization_folders = self.google_storage_connector.list_objects_concurrently(
+            bucket, organization_prefixes, delimiter='/'
+        )
+
+        account_prefixes = []
+        for organization_prefix in organization_prefixes:
+            org_in_prefix = organization_prefix[:-1]
+            sub_billing_account_ids = [
+                account_prefix[len(organization_prefix):-1]
+                for account_prefix in organization_folders[organization_prefix]['prefixes']
+            ]
+            account_prefixes.extend(
+                f'{organization_prefix}{sub_billing_account_id}/' for sub_billing_account_id
+                in self._check_sub_billing_account_id(sub_billing_account_ids, org_in_prefix, bucket)
+            )
+
+        account_folders = self.google_storage_connector.list_objects_concurrently(bucket, account_prefixes)
+
+        return [
+            object_info for account_prefix in account_prefixes
+            for object_info in account_folders[account_prefix]['items']
+        ]
+
+    @staticmethod
+    def _make_task(bucket, organization, sub_billing_account, start_time, end_time=None):
+        task_options = {
+            'bucket': bucket,
+            'organization': organization,
+            'sub_billing_account': sub_billing_account,
+            'start': start_time.strftime('%Y-%m-%d')
+        }
+
+        if end_time:
+            task_options['end'] = (end_time - timedelta(days=1)).strftime('%Y-%m-%d')
+
+        return {'task_options': task_options}
+
+    @staticmethod
+    def _get_billing_files(objects_info, task_info):
+        month_folders = {}
+        for object_info in objects_info:
+            try:
+                organization, sub_billing_account_id, year, month, file_name = object_info['name'].split('/', 4)
+            except ValueError:
+                continue
+
+            if sub_billing_account_id in task_info.get(organization, []):
+                month_folder = month_folders.setdefault((organization, sub_billing_account_id, year, month), {})
+                month_folder[object_info['name']] = object_info
+
+        billing_files = {}
+        for (organization, sub_billing_account_id, year, month), month_folder in month_folders.items():
+            # Only the files of the format that get_data reads are tracked.
+            for name in select_billing_files(month_folder):
+                object_info = month_folder[name]
+                billing_files[name] = {
+                    'organization': organization,
+                    'sub_billing_account': sub_billing_account_id,
+                    'month': f'{year}-{month}',
+                    'generation': object_info.get('generation'),
+                    'md5Hash': object_info.get('md5Hash'),
+                    'updated': object_info.get('updated'),
+                    'size': int(object_info.get('size', 0))
+                }
+
+        return billing_files
+
+    def _get_changed_months(self, billing_files, sync_state, scan_month, last_synchronized_at):
+        changed_months = set()
+
+        for file_name, billing_file in billing_files.items():
+            if billing_file['month'] >= scan_month and \
+                    self._is_changed_file(billing_file, sync_state.get(file_name), last_synchronized_at):
+                changed_months.add(billing_file['month'])
+
+        # Months whose files were removed since the last task generation
+        for file_name, file_state in sync_state.items():
+            if file_name not in billing_files and file_state['month'] >= scan_month:
+                changed_months.add(file_state['month'])
+
+        return changed_months
+
+    def _is_changed_file(self, billing_file, file_state, last_synchronized_at):
+        if not billing_file['updated']:
+            return True
+
+        if self._to_utc(parser.isoparse(billing_file['updated'])) < last_synchronized_at - _CHANGE_DETECTION_MARGIN:
+            return False
+
+        # Rewritten with the same content as the version handed out before the last synchronization
+        if file_state and file_state['md5Hash'] == billing_file['md5Hash']:
+            recorded_at = datetime.fromisoformat(file_state['recorded_at'])
+            if recorded_at <= last_synchronized_at + _SYNC_STATE_TOLERANCE:
+                return False
+
+        return True
+
+    @staticmethod
+    def _apply_daily_lookback(windows, billing_files, sync_state, last_synchronized_at, lookback_days):
+        """Start the windows of the lookback month at the lookback day instead of the first of the month.
+
+        The object listing only tells which months changed. With daily granularity, the days of a month that
+        was already synchronized before `lookback_days` ago are assumed final, so a re-sync of a month being
+        appended to only covers its recent days. A month with a new or removed file is synchronized whole.
+        """
+        lookback_start = (last_synchronized_at - timedelta(days=lookback_days)).replace(hour=0, minute=0, second=0,
+                                                                                       microsecond=0)
+        lookback_month = lookback_start.strftime('%Y-%m')
+
+        month_files = {name for name, billing_file in billing_files.items() if billing_file['month'] == lookback_month}
+        synced_files = {name for name, file_state in sync_state.items() if file_state['month'] == lookback_month}
+        if not month_files or month_files != synced_files:
+            return windows
+
+        return [
+            (lookback_start if window_start.strftime('%Y-%m') == lookback_month else window_start, window_end,
+             accounts)
+            for window_start, window_end, accounts in windows
+        ]
+
+    @staticmethod
+    def _make_sync_state(billing_files, sync_state, now):
+        new_sync_state = {}
+        for file_name, billing_file in billing_files.items():
+            file_state = sync_state.get(file_name)
+
+            if file_state and file_state['md5Hash'] == billing_file['md5Hash']:
+                recorded_at = file_state['recorded_at']
+            else:
+                recorded_at = now.isoformat()
+
+            new_sync_state[file_name] = {
+                'month': billing_file['month'],
+                'generation': billing_file['generation'],
+                'md5Hash': billing_file['md5Hash'],
+                'updated': billing_file['updated'],
+                'recorded_at': recorded_at
+            }
+
+        return new_sync_state
+
+    @staticmethod
+    def _get_month_sizes(billing_files):
+        month_sizes = {}
+        for billing_file in billing_files.values():
+            account = (billing_file['organization'], billing_file['sub_billing_account'])
+            account_month_sizes = month_sizes.setdefault(account, {})
+            account_month_sizes[billing_file['month']] = \
+                account_month_sizes.get(billing_file['month'], 0) + billing_file['size']
+
+        return month_sizes
+
+    def _get_task_ranges(self, window_start, window_end, month_sizes, max_months, max_size):
+        """Splits a window into contiguous month ranges of at most `max_months` months and about `max_size` bytes.
+
+        A month larger than `max_size` gets a range of its own. Ranges without any billing file are skipped.
+        """
+        if not max_months and not max_size:
+            data_months = [month for month in self._get_months(window_start, window_end or datetime.utcnow())
+                           if month in month_sizes]
+            if not data_months:
+                return []
+
+            # Start at the first month with a billing file
+            range_start = max(window_start, datetime.strptime(data_months[0], '%Y-%m'))
+            return [(range_start, window_end, sum(month_sizes[month] for month in data_months))]
+
+        month_ranges = []
+        range_months = []
+        range_size = 0
+        for month in self._get_months(window_start, window_end or datetime.utcnow()):
+            size = month_sizes.get(month, 0)
+            if range_months and ((max_months and len(range_months) >= max_months) or
+                                 (max_size and range_size + size > max_size)):
+                month_ranges.append((range_months, range_size))
+                range_months = []
+                range_size = 0
+
+            range_months.append(month)
+            range_size += size
+
+        if range_months:
+            month_ranges.append((range_months, range_size))
+
+        task_ranges = []
+        for index, (range_months, range_size) in enumerate(month_ranges):
+            if not any(month in month_sizes for month in range_months):
+                continue
+
+            range_start = window_start if index == 0 else datetime.strptime(range_months[0], '%Y-%m')
+            if index == len(month_ranges) - 1:
+                range_end = window_end
+            else:
+                range_end = datetime.strptime(month_ranges[index + 1][0][0], '%Y-%m')
+
+            task_ranges.append((range_start, range_end, range_size))
+
+        return task_ranges
+
+    @staticmethod
+    def _get_month_windows(months):
+        windows = []
+        for month in sorted(months):
+            month_start = datetime.strptime(month, '%Y-%m')
+            month_end = (month_start + timedelta(days=32)).replace(day=1)
+
+            if windows and windows[-1][1] == month_start:
+                windows[-1] = (windows[-1][0], month_end)
+            else:
+                windows.append((month_start, month_end))
+
+        return windows
+
+    @staticmethod
+    def _get_months(start_time, end_time):
+        months = []
+        month_start = start_time.replace(day=1)
+        while month_start < end_time:
+            months.append(month_start.strftime('%Y-%m'))
+            month_start = (month_start + timedelta(days=32)).replace(day=1)
+
+        return months
+
+    @staticmethod
+    def _to_utc(timestamp: datetime):
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone(tz.tzutc()).replace(tzinfo=None)
+
+        return timestamp
+
     @staticmethod
     def _get_start_time(start, last_synchronized_at=None):
         if start:
@@ -105,13 +436,14 @@ class JobManager(BaseManager):
 
     @staticmethod
     def _check_sub_billing_account_id(sub_billing_account_ids, organization, bucket_name):
-        pattern = r'^[A-Z0-9]{6}-[A-Z0-9]{6}-[A-Z0-9]{6}'
+        valid_sub_billing_account_ids = []
         for sub_billing_account_id in sub_billing_account_ids:
-            if not re.fullmatch(pattern, sub_billing_account_id):
+            if re.fullmatch(_SUB_BILLING_ACCOUNT_ID_PATTERN, sub_billing_account_id):
+                valid_sub_billing_account_ids.append(sub_billing_account_id)
+            else:
                 _LOGGER.debug(
                     f'[get_tasks] Not valid sub_billing_account_id: '
                     f'{bucket_name}/{organization}/{sub_billing_account_id}'
                 )
-                sub_billing_account_ids.remove(sub_billing_account_id)
 
-        return sub_billing_account_ids
+        return valid_sub_billing_account_ids
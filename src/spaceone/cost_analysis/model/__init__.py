@@ -1,2 +1,3 @@
 from spaceone.cost_analysis.model.data_source_model import *
-from spaceone.cost_analysis.model.job_model import *
\ No newline at end of file
+from spaceone.cost_analysis.model.job_model import *
+from spaceone.cost_analysis.model.billing_schema import *
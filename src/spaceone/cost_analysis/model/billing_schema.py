@@ -0,0 +1,58 @@
+import csv
+
+__all__ = ['BillingSchema', 'MZC_BILLING_SCHEMA', 'BILLING_FILE_EXTENSIONS', 'select_billing_files']
+
+# Billing exports are CSVs, possibly compressed, or Parquet files, in order of preference when a month folder
+# holds the same export in several formats. CSVs stored with `Content-Encoding: gzip` keep the `.csv` extension.
+BILLING_FILE_EXTENSIONS = ('.parquet', '.csv.zst', '.csv.gz', '.csv')
+
+
+def select_billing_files(file_names) -> list:
+    """Returns the billing files of the most preferred format among `file_names`."""
+    billing_files = {}
+    for file_name in file_names:
+        for extension in BILLING_FILE_EXTENSIONS:
+            if file_name.endswith(extension):
+                billing_files.setdefault(extension, []).append(file_name)
+                break
+
+    return next((billing_files[extension] for extension in BILLING_FILE_EXTENSIONS if extension in billing_files), [])
+
+
+class BillingSchema:
+    """Columns of a billing export that the plugin reads, with their parse dtypes.
+
+    Header names are matched after stripping whitespace, since the exports pad some of them.
+    Repeated strings are parsed as `category`, so each distinct value is held only once per page.
+    """
+
+    def __init__(self, columns: dict, required_columns: list):
+        self.columns = columns
+        self.required_columns = required_columns
+
+    def resolve_columns(self, header: str) -> dict:
+        """Returns the raw header names of the schema columns, mapped to their stripped names."""
+        return self.resolve_names(next(csv.reader([header]), []))
+
+    def resolve_names(self, names: list) -> dict:
+        return {name: name.strip() for name in names if name.strip() in self.columns}
+
+    def get_missing_columns(self, resolved_columns: dict) -> list:
+        return [column for column in self.required_columns if column not in resolved_columns.values()]
+
+    def get_dtypes(self, resolved_columns: dict) -> dict:
+        return {column: self.columns[name] for column, name in resolved_columns.items()}
+
+
+MZC_BILLING_SCHEMA = BillingSchema(
+    columns={
+        '소계': 'float64',
+        'Service Name': 'category',
+        'SKU Name': 'category',
+        'Project ID': 'category',
+        'Project Name': 'category',
+        'SBA Name': 'category',
+        'Usage Start Date': 'category'
+    },
+    required_columns=['소계', 'Service Name', 'SKU Name']
+)
@@ -7,6 +7,7 @@ __all__ = ['Tasks']
 
 class TaskOptions(Model):
     start = StringType(required=True)
+    end = StringType(default=None)
     bucket = StringType(required=True)
     organization = StringType(required=True)
     sub_billing_account = StringType(default=None)